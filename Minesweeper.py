@@ -1,5 +1,23 @@
+import argparse
+import concurrent.futures
+import os
+import struct
+import sys
+import time
+
 import pygame
-import random
+
+import savegame
+from board import Board, ADJACENT, COVERED, FLAGGED, MINE
+from chunked import ChunkedBoard, MIN_DENSITY
+from history import History
+from layout import BoardLayout
+from noguess import BoardPool
+from profiler import Profiler
+from replay import Recorder
+from server import Connection, RemoteBoard
+from solver import Solver
+from stats import Stats, three_bv
 
 class Color(object):
     """ store color values in constants to not use harcoded values later
@@ -16,6 +34,66 @@ class Color(object):
     MAROON = (128, 0, 0)
     TURQUOISE = (48, 213, 200)
 
+    # colour of the number on an uncovered tile, by how many mines are next to it
+    NUMBERS = {
+        1: BLUE,
+        2: GREEN,
+        3: RED,
+        4: DARK_BLUE,
+        5: MAROON,
+        6: TURQUOISE,
+        7: BLACK,
+        8: GRAY,
+    }
+
+class Assets(object):
+    """ loads every image, font and set of tile sprites the first time it is asked for and keeps it
+    for the rest of the process, so restarting the game doesn't touch the disk or the font list
+    """
+    # images are found next to this file so the game can be started from any directory
+    DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+    def __init__(self):
+        self.images = {}
+        self.fonts = {}
+        self.sprites = {}
+
+    def image(self, name, size):
+        """returns the image file name scaled to size, needs the display to be set up first
+        because it is converted to the display's pixel format
+        """
+        key = (name, size)
+        image = self.images.get(key)
+        if image is None:
+            image = pygame.image.load(os.path.join(self.DIRECTORY, name)).convert_alpha()
+            image = self.images[key] = pygame.transform.scale(image, size)
+        return image
+
+    def font(self, size, system=False):
+        """returns pygame's default font at size, or the default system font when system is set
+        """
+        key = (size, system)
+        font = self.fonts.get(key)
+        if font is None:
+            if system:
+                font = pygame.font.SysFont(None, size)
+            else:
+                font = pygame.font.Font(None, size)
+            self.fonts[key] = font
+        return font
+
+    def tile_sprites(self, tile_size, gap):
+        """returns the sprite cache for tiles of tile_size
+        """
+        key = (tile_size, gap)
+        sprites = self.sprites.get(key)
+        if sprites is None:
+            sprites = self.sprites[key] = TileSprites(self, tile_size, gap)
+        return sprites
+
+# the assets shared by every Game in this process
+assets = Assets()
+
 class GameState(object):
     """ changes the game states which are used in the code to fulfill conditions"""
     def __init__(self):
@@ -63,7 +141,7 @@ class TutorialScreen(object):
         """
         self.game = game
         # Font for tutorial text
-        self.font = pygame.font.Font(None, 30)
+        self.font = assets.font(30)
         # Color for tutorial text
         self.text_color = Color.BLACK
         self.message = [
@@ -75,6 +153,13 @@ class TutorialScreen(object):
             "If you uncover a mine, you lose the game.",
             "The numbers say how many mines are adjacent to the tile cleared",
             "",
+            "Press H to show or hide hints",
+            "CTRL+Z undoes a move and CTRL+Y redoes it",
+            "Press L to show or hide the best times",
+            "Arrow keys or the mouse wheel scroll big boards",
+            "+ and - or ctrl and the mouse wheel zoom",
+            "Press F5 to save the game and F9 to load it",
+            "Press F3 to show or hide the frame timings",
             "Press R to restart",
             "Press ESCAPE to quit"
             "",
@@ -97,7 +182,7 @@ class TutorialScreen(object):
         """
         for event in events:
             if event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
-                self.game.gamestate.set_state_game()
+                self.game.play()
 
 class GameWonScreen(object):
     """ handles all functions needed for the game won screen to be displayed and function properly
@@ -106,7 +191,7 @@ class GameWonScreen(object):
         """ contains information about the text so that we don't hardcode in draw and it is used in the draw function to pass information
         """
         self.game = game
-        self.font = pygame.font.Font(None, 30)
+        self.font = assets.font(30)
         self.text_color = Color.BLACK
         self.message = [
             "Congratulations! You win!",
@@ -119,7 +204,7 @@ class GameWonScreen(object):
     def draw(self):
         """ draws the game won screen using the information in the init function
         """
-        for i, message in enumerate(self.message):
+        for i, message in enumerate(self.message[:1] + self.game.result + self.message[1:]):
             text = self.font.render(message, True, self.text_color)
             text_rect = text.get_rect(center=(self.game.win.get_width() // 2,100 + i * 30))
             self.game.win.blit(text, text_rect)
@@ -131,6 +216,50 @@ class GameWonScreen(object):
             if event.type == pygame.KEYDOWN and event.key == pygame.K_r:
                 self.game.restart()
 
+class LeaderboardScreen(object):
+    """ shows the best times and how many games were won on the kind of board being played
+    """
+    # best times shown
+    PLACES = 10
+
+    def __init__(self, game):
+        self.game = game
+        self.font = assets.font(30)
+        self.text_color = Color.BLACK
+
+    def lines(self):
+        """returns the text of the screen, read from the statistics when it is drawn
+        """
+        game = self.game
+        stats = game.stats
+        tiles = game.tiles
+        no_guess = tiles.board.safe is not None
+        lines = [f"Best times, {tiles.num_rows}x{tiles.num_columns} with {tiles.num_mines} mines"
+                 + (" without guessing" if no_guess else ""), ""]
+        if stats is None:
+            return lines + ["No statistics are kept", "", "Press L to go back"]
+        kind = (tiles.num_rows, tiles.num_columns, tiles.num_mines, no_guess)
+        best = stats.best_times(kind, self.PLACES)
+        for place, (milliseconds, bbbv, clicks, finished) in enumerate(best, 1):
+            line = f"{place}.  {milliseconds / 1000:.3f} s  {time.strftime('%Y-%m-%d', time.localtime(finished))}"
+            if bbbv:
+                line += f"  3BV {bbbv}  {bbbv / max(milliseconds, 1) * 1000:.2f}/s"
+            lines.append(line)
+        if not best:
+            lines.append("No wins yet")
+        games, wins = stats.counts(kind)
+        lines.append("")
+        lines.append(f"{wins} of {games} games won")
+        if wins:
+            lines.append(f"Median win {stats.percentile(kind, 0.5) / 1000:.3f} s")
+        return lines + ["", "Press L to go back"]
+
+    def draw(self):
+        for i, message in enumerate(self.lines()):
+            text = self.font.render(message, True, self.text_color)
+            text_rect = text.get_rect(center=(self.game.win.get_width() // 2, 100 + i * 30))
+            self.game.win.blit(text, text_rect)
+
 class ResetButton(object):
     """ displays an image which calls the reset function when clicked
     """
@@ -139,7 +268,7 @@ class ResetButton(object):
         self.game = game
         x = (self.game.win.get_width() // 2)
         y = (self.game.win.get_height() - 30)
-        self.image = pygame.transform.scale(pygame.image.load('reset_button.png'), (Tiles.TILE_SIZE, Tiles.TILE_SIZE))
+        self.image = assets.image('reset_button.png', (Tiles.TILE_SIZE, Tiles.TILE_SIZE))
         self.rect = self.image.get_rect(center=(x, y))
 
     def draw(self):
@@ -151,39 +280,197 @@ class ResetButton(object):
         """ calls the restart function when the image is clicked
         """
         if self.rect.collidepoint(pos):
-            game.restart()
+            self.game.restart()
 
 class GameClock(object):
-    """ creates a clock to display your time
+    """ times the game to the millisecond with time.perf_counter. it is started by the first
+    click and stopped by the move that ends the game, so the time doesn't depend on when
+    frames are drawn. the time on screen changes every second while it runs and shows the
+    milliseconds once it stops
     """
-    def __init__(self):
+    def __init__(self, game):
+        self.game = game
 
-        # sets how much time has passed
-        self.time_elapsed = 0
+        # perf_counter() at the time the clock would have shown 0, None while it is stopped
+        self.start_time = None
 
-        # sets the time you start with
-        self.start_time = 0
-    
-    def clock(self):
+        # milliseconds on the clock when it was stopped
+        self.stopped_at = 0
 
-        if self.start_time != 0 and not game.gamestate.game_over and not game.gamestate.game_won:
-            self.time_elapsed = (pygame.time.get_ticks() - self.start_time) // 1000
+        self.text = CounterText(game, (game.win.get_width() - 128, game.view_rect.height + 5))
+
+    def running(self):
+        return self.start_time is not None
+
+    def start(self):
+        """starts the clock, or lets it carry on from where it was stopped
+        """
+        if self.start_time is None:
+            self.start_time = time.perf_counter() - self.stopped_at / 1000
 
-        if not game.gamestate.tutorial:
-            font = pygame.font.SysFont(None, 36)
-            clock_text = font.render(f"Time: {self.time_elapsed}", True, Color.RED)
-            game.win.blit(clock_text, (760, 885))
+    def stop(self):
+        if self.start_time is not None:
+            self.stopped_at = self.elapsed()
+            self.start_time = None
+
+    def reset(self):
+        self.start_time = None
+        self.stopped_at = 0
+
+    def clock(self, full=False):
+        """ draws the time when it has changed, returns the areas that were drawn
+        """
+        if self.game.gamestate.tutorial:
+            return []
+        elapsed = self.elapsed()
+        if self.start_time is None and elapsed:
+            return self.text.draw(f"Time: {elapsed / 1000:.3f}", full)
+        return self.text.draw(f"Time: {elapsed // 1000}", full)
+
+    def time_to_next_tick(self):
+        """returns the milliseconds until the time shown changes, or None when the clock is stopped
+        """
+        if self.start_time is None or self.game.gamestate.tutorial:
+            return None
+        return 1000 - self.elapsed() % 1000
+
+    def elapsed(self):
+        """returns the milliseconds on the clock
+        """
+        if self.start_time is None:
+            return self.stopped_at
+        return int((time.perf_counter() - self.start_time) * 1000)
+
+    def resume(self, elapsed, started):
+        """sets the clock to elapsed milliseconds, running from now on when started is set
+        """
+        self.stopped_at = elapsed
+        self.start_time = None
+        if started:
+            self.start()
+
+class CounterText(object):
+    """ a line of red text, like the clock, that is only drawn again when it changes
+    """
+    def __init__(self, game, position):
+        self.game = game
+        self.position = position
+
+        # the text and area of the last time it was drawn
+        self.text = None
+        self.rect = None
+
+    def draw(self, text, full=False):
+        """ draws the text if it changed or the whole window is being drawn, returns the areas that were drawn
+        """
+        if text == self.text and not full:
+            return []
+        rects = []
+        if self.rect is not None and not full:
+            self.game.win.fill(Color.BACKGROUND, self.rect)
+            rects.append(self.rect)
+        surface = assets.font(36, system=True).render(text, True, Color.RED)
+        self.rect = self.game.win.blit(surface, self.position)
+        rects.append(self.rect)
+        self.text = text
+        return rects
+
+class ProfilerOverlay(object):
+    """ a box in the corner of the board with the frame timings of the profiler, it is only
+    drawn again every REFRESH_MS or when tiles were drawn over it
+    """
+    # milliseconds between updates of the numbers
+    REFRESH_MS = 500
+
+    SIZE = (380, 98)
+
+    def __init__(self, game):
+        self.game = game
+        self.rect = pygame.Rect((game.view_rect.left + 4, game.view_rect.top + 4), self.SIZE)
+        self.surface = pygame.Surface(self.SIZE).convert()
+
+        # ticks at the last time the numbers were updated
+        self.updated = None
+
+    def lines(self):
+        """returns the text of the box from the last frames the profiler kept
+        """
+        stats = self.game.profiler.stats()
+        frame = stats['frame_ms']
+        click = stats['click_ms']
+        sections = stats['sections_ms']
+        tiles = stats['tiles_redrawn']
+        lines = [f"{stats['frames']} frames"]
+        if frame is None:
+            lines.append("frame ms  -")
+        else:
+            lines.append(f"frame ms  p50 {frame['p50']:.2f}  p95 {frame['p95']:.2f}  p99 {frame['p99']:.2f}"
+                         f"  max {frame['max']:.2f}")
+        if click is None:
+            lines.append("click ms  -")
+        else:
+            lines.append(f"click ms  p50 {click['p50']:.2f}  p95 {click['p95']:.2f}  max {click['max']:.2f}")
+        lines.append("ms/frame  " + "  ".join(f"{name} {ms:.2f}" for name, ms in sections.items()))
+        lines.append(f"tiles/frame  {tiles['mean']:.1f}  max {tiles['max']}")
+        return lines
+
+    def draw(self, rects, full=False):
+        """ draws the box when the numbers are due an update, the whole window is being drawn or
+        one of rects was drawn over it, returns the areas that were drawn
+        """
+        now = pygame.time.get_ticks()
+        if self.updated is None or now - self.updated >= self.REFRESH_MS:
+            self.surface.fill(Color.BLACK)
+            font = assets.font(20)
+            for i, line in enumerate(self.lines()):
+                self.surface.blit(font.render(line, True, Color.WHITE), (6, 5 + i * 18))
+            self.updated = now
+        elif not full and self.rect.collidelist(rects) == -1:
+            return []
+        return [self.game.win.blit(self.surface, self.rect)]
 
 class GameEventHandler(object):
-    """ handles game events, only clicks currently"""
+    """ handles game events, clicks and moving the view around the board"""
+
+    # tiles moved by one press of an arrow key or one step of the mouse wheel
+    SCROLL_TILES = 3
+
+    def __init__(self, game):
+        self.game = game
+
+    def view(self, events):
+        """ scrolls with the arrow keys and the mouse wheel, zooms with + and - or ctrl and the wheel
+        """
+        if self.game.current_screen() != 'board':
+            return
+        step = self.game.tiles.layout.pitch * self.SCROLL_TILES
+        arrows = {
+            pygame.K_LEFT: (-step, 0),
+            pygame.K_RIGHT: (step, 0),
+            pygame.K_UP: (0, -step),
+            pygame.K_DOWN: (0, step),
+        }
+        for event in events:
+            if event.type == pygame.KEYDOWN:
+                if event.key in arrows:
+                    self.game.scroll(*arrows[event.key])
+                elif event.key in (pygame.K_PLUS, pygame.K_EQUALS, pygame.K_KP_PLUS):
+                    self.game.zoom(1)
+                elif event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+                    self.game.zoom(-1)
+            elif event.type == pygame.MOUSEWHEEL:
+                if pygame.key.get_mods() & pygame.KMOD_CTRL:
+                    self.game.zoom(event.y, pygame.mouse.get_pos())
+                else:
+                    self.game.scroll(event.x * step, -event.y * step)
 
     def click(self, events):
 
-        if not game.gamestate.tutorial:
+        if not self.game.gamestate.tutorial and not self.game.show_leaderboard:
             mouse_button_events = [event for event in events if event.type == pygame.MOUSEBUTTONUP]
             
             for event in mouse_button_events:
-                mouse_pos = pygame.mouse.get_pos()
+                mouse_pos = event.pos
                 if event.button == 1:
                     self.left_click(mouse_pos)
                     self.reset_button_click(mouse_pos)
@@ -192,74 +479,242 @@ class GameEventHandler(object):
                     self.right_click(mouse_pos)
 
     def left_click(self, mouse_pos):
-        if not game.gamestate.game_over and game.tiles.collidepoint(mouse_pos):
-            if game.gameclock.start_time == 0:
-                game.gameclock.start_time = pygame.time.get_ticks()
-            game.tiles.uncover(mouse_pos)
+        cell = self.game.tiles.layout.cell_at(mouse_pos)
+        if not self.game.gamestate.game_over and cell is not None:
+            self.game.gameclock.start()
+            self.game.tiles.clicks += 1
+            self.game.tiles.uncover(*cell)
+            if self.game.tiles.recorder is not None:
+                self.game.tiles.recorder.uncover(*cell)
 
     def right_click(self, mouse_pos):
-        if not game.gamestate.game_over and game.tiles.collidepoint(mouse_pos):
-            game.tiles.flag(mouse_pos)
+        cell = self.game.tiles.layout.cell_at(mouse_pos)
+        if not self.game.gamestate.game_over and cell is not None:
+            self.game.tiles.clicks += 1
+            self.game.tiles.flag(*cell)
+            if self.game.tiles.recorder is not None:
+                self.game.tiles.recorder.flag(*cell)
     
     def reset_button_click(self, mouse_pos):
-        game.reset_button.handle_click(mouse_pos)
+        self.game.reset_button.handle_click(mouse_pos)
         
 class Game(object):
     """ manages the main game features such as the restart function and the main game loop"""
 
-    def __init__(self):
+    # height of the bar under the board with the counters and the reset button
+    BAR_HEIGHT = 58
+
+    # smallest window that still fits the tutorial and the bar
+    MIN_WIDTH = 700
+    MIN_HEIGHT = 600
+
+    # boards with more tiles than this are generated in chunks as they are looked at
+    CHUNKED_TILES = 1 << 22
+
+    def __init__(self, fps=60, wait_when_idle=True, board_pool=None, num_rows=16, num_columns=16, num_mines=40,
+                 density=None, chunk_size=64, record_dir=None, save_path=None, metrics_path=None,
+                 metrics_interval=1.0, connection=None, stats=None):
+        """ fps caps the frame rate, 0 means no cap. with wait_when_idle the loop sleeps until
+        there is an event or the clock needs to tick instead of drawing frames nobody sees.
+        when board_pool is a noguess.BoardPool every board comes from it and can be solved
+        without guessing. with a density the board is a chunked.ChunkedBoard with that fraction
+        of mines in every chunk, boards with more than CHUNKED_TILES tiles need one.
+        with record_dir every game is recorded there as a replay file. save_path is the file
+        the game is saved to and loaded from. with metrics_path the frame timings are written
+        there every metrics_interval seconds, see profiler.py. with a server.Connection the
+        boards are played on the server instead of in this process. every game that ends is
+        added to stats, a stats.Stats, when it is given
+        """
+        self.fps = fps
+        self.record_dir = record_dir
+        self.save_path = save_path
+        self.metrics_path = metrics_path
+        self.connection = connection
+        self.stats = stats
+        self.board_pool = board_pool
+        self.wait_when_idle = wait_when_idle
+        self.frame_clock = pygame.time.Clock()
+
+        # times the frames while the overlay is shown or metrics are written, None otherwise so
+        # the hooks in the loop cost next to nothing
+        self.profiler = None
+        if metrics_path is not None:
+            self.profiler = Profiler(metrics_path, metrics_interval)
+
+        self.configure(num_rows, num_columns, num_mines, density, chunk_size)
+        if board_pool is not None and self.density is not None:
+            raise ValueError("no-guess boards can't be generated in chunks")
+        if connection is not None and (board_pool is not None or self.density is not None):
+            raise ValueError("boards played on a server can't be no-guess or chunked")
+
+        # size of the tiles on screen, changed by zooming and kept when the game restarts
+        self.tile_size = Tiles.TILE_SIZE
 
         # Create the game window
-        self.win = pygame.display.set_mode((888, 938))
+        self.win = pygame.display.set_mode(self.window_size())
+
+        # the part of the window the board is drawn in, the bar is below it
+        self.view_rect = pygame.Rect(0, 0, self.win.get_width(), self.win.get_height() - self.BAR_HEIGHT)
+
+        # held arrow keys keep scrolling
+        pygame.key.set_repeat(300, 40)
 
         # sets the cursor as visible
         pygame.mouse.set_visible(True)
 
-        # sets the look of the cursor
-        pygame.mouse.set_cursor(*pygame.cursors.tri_left)
+        # sets the look of the cursor, the dummy video driver used by the benchmarks has no cursor
+        try:
+            pygame.mouse.set_cursor(*pygame.cursors.tri_left)
+        except pygame.error:
+            pass
+
+        # the screen that was drawn last frame, everything is drawn again when it changes
+        self.screen = None
+
+        # draw the solver's hints over the covered tiles
+        self.show_hints = False
+
+        # the box with the frame timings, None while it is hidden
+        self.overlay = None
+
+        # show the best times instead of the board
+        self.show_leaderboard = False
+
+        # lines about the time of the last game that was won, for the game won screen
+        self.result = []
 
         self.tutorial_screen = TutorialScreen(self)
         self.game_won_screen = GameWonScreen(self)
+        self.leaderboard_screen = LeaderboardScreen(self)
         self.reset_button = ResetButton(self)
         self.gamestate = GameState()
-        self.gameclock = GameClock()
-        self.gameeventhandler = GameEventHandler()
+        self.gameclock = GameClock(self)
+        self.gameeventhandler = GameEventHandler(self)
+
+        # works out the 3BV of the boards for the statistics without holding up the frames
+        self.background = concurrent.futures.ThreadPoolExecutor(1)
+
         self.tiles = Tiles(self)
 
+    def configure(self, num_rows, num_columns, num_mines, density=None, chunk_size=64):
+        """sets the size of the boards to play, see __init__
+        """
+        self.num_rows = num_rows
+        self.num_columns = num_columns
+        self.num_mines = num_mines
+        if density is None and num_rows * num_columns > self.CHUNKED_TILES:
+            raise ValueError(f"boards with more than {self.CHUNKED_TILES} tiles are generated in chunks and "
+                             f"need a density")
+        if density is not None and not MIN_DENSITY <= density < 1:
+            raise ValueError(f"the density of a board in chunks must be at least {MIN_DENSITY} and below 1, "
+                             f"not {density}")
+        self.density = density
+        self.chunk_size = chunk_size
+
+    def window_size(self):
+        """returns the size of the window, big enough for the whole board when it fits on the
+        screen and otherwise as big as the screen allows, the board then scrolls
+        """
+        pitch = Tiles.TILE_SIZE + Tiles.GAP
+        width = max(self.num_columns * pitch + Tiles.BUFFER + Tiles.GAP, self.MIN_WIDTH)
+        height = max(self.num_rows * pitch + self.BAR_HEIGHT, self.MIN_HEIGHT)
+        try:
+            screen_width, screen_height = pygame.display.get_desktop_sizes()[0]
+        except (pygame.error, IndexError):
+            screen_width, screen_height = 1280, 1024
+        # leave room for the title bar and task bar, but never shrink the standard board
+        return min(width, max(screen_width - 40, 888)), min(height, max(screen_height - 80, 938))
+
     def handle_game_events(self, events):
         if self.gamestate.tutorial:
             self.tutorial_screen.handle_events(events)
 
+        self.gameeventhandler.view(events)
         self.gameeventhandler.click(events)
 
-    def draw(self):
-        """calls the draw functions required under certain circumstances
+    def timed(self, name, function, *args):
+        """returns function(*args), counting the time it took as the section name of the frame
+        when the profiler is on
         """
-        self.win.fill(Color.BACKGROUND)
-        self.tiles.draw()
-        self.reset_button.draw()
+        if self.profiler is None:
+            return function(*args)
+        return self.profiler.call(name, function, *args)
 
+    def scroll(self, dx, dy):
+        """moves the view of the board by (dx, dy) pixels
+        """
+        if self.tiles.layout.scroll(dx, dy):
+            self.screen = None
+
+    def zoom(self, steps, anchor=None):
+        """makes the tiles steps sizes bigger, or smaller for negative steps, keeping the tile
+        under anchor in place, the middle of the view by default
+        """
+        sizes = Tiles.ZOOM_SIZES
+        i = min(max(sizes.index(self.tile_size) + steps, 0), len(sizes) - 1)
+        if sizes[i] == self.tile_size:
+            return
+        self.tile_size = sizes[i]
+        self.tiles.zoom(self.tile_size, anchor or self.view_rect.center)
+        self.screen = None
+
+    def current_screen(self):
+        """returns which screen the game state shows, game over still shows the board
+        """
+        if self.gamestate.tutorial:
+            return 'tutorial'
+        if self.show_leaderboard:
+            return 'leaderboard'
         if self.gamestate.game_won:
+            return 'game_won'
+        return 'board'
+
+    def draw(self, full=False):
+        """draws what changed since the last frame, or everything when the screen changed or full
+        is set, and returns the areas of the window that need to be updated
+        """
+        screen = self.current_screen()
+        if screen != self.screen:
+            full = True
+            self.screen = screen
+
+        rects = []
+        if full:
             self.win.fill(Color.BACKGROUND)
-            self.game_won_screen.draw()
-        
-        if self.gamestate.tutorial:
-            self.tutorial_screen.draw()
-        
-        if self.gamestate.game:
-            self.tiles.draw()
-        
-        self.gameclock.clock()
+            rects.append(self.win.get_rect())
+
+        if screen == 'tutorial':
+            if full:
+                self.tutorial_screen.draw()
+            return rects
+
+        if screen == 'leaderboard':
+            if full:
+                self.leaderboard_screen.draw()
+        elif screen == 'game_won':
+            if full:
+                self.game_won_screen.draw()
+        else:
+            rects.extend(self.timed('tiles', self.tiles.draw, full))
+            if full:
+                self.reset_button.draw()
+
+        rects.extend(self.timed('clock', self.gameclock.clock, full))
+        if self.overlay is not None and screen == 'board':
+            rects.extend(self.overlay.draw(rects, full))
+        return rects
+
+    def present(self, full=False):
+        """draws the frame and copies only the changed areas to the screen
+        """
+        rects = self.draw(full)
+        if rects:
+            self.timed('display', pygame.display.update, rects)
 
     def count_remaining_flags(self):
         """counts the amount of flags compared to be used in the flag function later
         """
-        count = 0
-        for row in self.tiles.tile_state:
-            for tile in row:
-                if tile['flagged'] and tile['covered']:
-                    count += 1
-        return count
+        return self.tiles.board.num_flags
 
     def loop(self):
         """ handles the main game loop
@@ -267,279 +722,599 @@ class Game(object):
         run = True
         while run:
 
-            events = pygame.event.get()
+            events = self.get_events()
+            # F3 can switch the profiler on or off, the frame is finished by the one it started with
+            profiler = self.profiler
+            if profiler is not None:
+                profiler.start_frame()
             for event in events:
                 if event.type == pygame.QUIT:
                     run = False
                 if event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_r:
                         self.restart()
+                    if event.key == pygame.K_h:
+                        self.toggle_hints()
+                    if event.key == pygame.K_l:
+                        self.show_leaderboard = not self.show_leaderboard
+                    if event.key == pygame.K_F5:
+                        self.save()
+                    if event.key == pygame.K_F9:
+                        self.load()
+                    if event.key == pygame.K_F3:
+                        self.toggle_profiler()
+                    if event.key == pygame.K_z and event.mod & pygame.KMOD_CTRL:
+                        self.tiles.undo()
+                    if event.key == pygame.K_y and event.mod & pygame.KMOD_CTRL:
+                        self.tiles.redo()
                     if event.key == pygame.K_ESCAPE:
                         run = False
-            self.handle_game_events(events)
-            self.draw()
+            self.timed('events', self.handle_game_events, events)
+            self.present()
+            if profiler is not None:
+                profiler.end_frame(any(event.type == pygame.MOUSEBUTTONUP for event in events))
+            self.frame_clock.tick(self.fps)
+
+    def get_events(self):
+        """returns the waiting events, when waiting while idle it first sleeps until there is an
+        event or until the clock on screen has to show the next second
+        """
+        if self.wait_when_idle:
+            timeout = self.gameclock.time_to_next_tick()
+            if timeout is None:
+                event = pygame.event.wait()
+            else:
+                event = pygame.event.wait(timeout)
+            events = [] if event.type == pygame.NOEVENT else [event]
+            return events + pygame.event.get()
+        return pygame.event.get()
+
+    def finished(self):
+        """stops the clock when a move ended the game, and adds the game to the statistics the
+        first time it ends so undoing a loss can't turn it into a win
+        """
+        self.gameclock.stop()
+        milliseconds = self.gameclock.elapsed()
+        self.result = [f"Your time: {milliseconds / 1000:.3f} s"]
+        tiles = self.tiles
+        board = tiles.board
+        if tiles.finished:
+            return
+        tiles.finished = True
+        # the moves of a game on a server are only known to the server
+        if self.stats is None or isinstance(board, RemoteBoard):
+            return
+        # a game that ended before the 3BV was worked out is recorded without it
+        bbbv = None
+        if tiles.three_bv is not None and tiles.three_bv.done() and not tiles.three_bv.cancelled():
+            bbbv = tiles.three_bv.result()
+        kind = (board.num_rows, board.num_columns, board.num_mines, board.safe is not None)
+        self.stats.record(*kind, board.seed, milliseconds, tiles.clicks, bbbv, board.game_won)
+        if board.game_won:
+            slower, wins = self.stats.rank(kind, milliseconds)
+            if wins > 1:
+                self.result.append(f"Faster than {slower / (wins - 1):.0%} of your other wins")
+
+    def toggle_hints(self):
+        """shows or hides the chance of a mine on the covered tiles
+        """
+        self.show_hints = not self.show_hints
 
-            pygame.display.flip()
+    def toggle_profiler(self):
+        """shows or hides the frame timings, the profiler only keeps running while they are
+        hidden when it writes metrics
+        """
+        if self.overlay is None:
+            if self.profiler is None:
+                self.profiler = Profiler()
+            self.overlay = ProfilerOverlay(self)
+        else:
+            self.overlay = None
+            if self.metrics_path is None:
+                self.profiler = None
+            # draw the tiles that were under the box
+            self.screen = None
 
     def restart(self):
         """restarts the game to the tutorial state when triggered
         """
+        self.close()
         self.tiles = Tiles(self)
-        self.gamestate.set_state_game()
-        self.gameclock.start_time = 0
-        self.gameclock.time_elapsed = 0 
+        self.screen = None
+        self.play()
+        self.gameclock.reset()
+
+    def play(self):
+        """shows the board of a new game, or the game won screen when its opening already won it
+        """
+        if self.tiles.board.game_won:
+            self.result = []
+            self.gamestate.set_state_game_won()
+        else:
+            self.gamestate.set_state_game()
+
+    def save(self):
+        """saves the game in progress to save_path
+        """
+        if self.save_path is None:
+            return
+        gamestate = self.gamestate
+        if gamestate.tutorial:
+            screen = savegame.TUTORIAL
+        elif gamestate.game_over:
+            screen = savegame.LOST
+        elif gamestate.game_won:
+            screen = savegame.WON
+        else:
+            screen = savegame.GAME
+        savegame.save(self.save_path, self.tiles.board, screen, self.gameclock.elapsed(),
+                      self.gameclock.running())
+
+    def load(self):
+        """carries on with the game saved in save_path, the window keeps its size and a
+        bigger board scrolls. restarting after that plays boards of the loaded size, a loaded
+        game is not recorded
+        """
+        if self.save_path is None or not os.path.exists(self.save_path):
+            return
+        try:
+            board, screen, elapsed, started = savegame.load(self.save_path)
+        except (ValueError, struct.error, OSError) as error:
+            # a broken save leaves the game being played alone
+            print(f"can't load {self.save_path}: {error}", file=sys.stderr)
+            return
+        density = board.density if isinstance(board, ChunkedBoard) and board.density else None
+        # a plain save too big to load whole goes on with chunked boards about as full of mines
+        if density is None and board.num_rows * board.num_columns > self.CHUNKED_TILES:
+            density = board.num_mines / (board.num_rows * board.num_columns)
+        if density is not None:
+            density = min(max(density, MIN_DENSITY), 0.99)
+        self.resume(board, screen, elapsed, started, density, getattr(board, 'chunk_size', self.chunk_size))
+
+    def attach(self, session):
+        """carries on with a game on the server, like load()
+        """
+        board = RemoteBoard.attach(self.connection, session)
+        screen = savegame.LOST if board.game_over else savegame.WON if board.game_won else savegame.GAME
+        self.resume(board, screen, board.elapsed, board.running)
 
-class Tile(object):
-    """handles individual tiles
+    def resume(self, board, screen, elapsed, started, density=None, chunk_size=64):
+        """shows a board that was played before on the screen it was on, with elapsed
+        milliseconds on the clock
+        """
+        self.close()
+        self.configure(board.num_rows, board.num_columns, board.num_mines, density, chunk_size)
+        self.tiles = Tiles(self, board=board)
+        self.screen = None
+        if screen == savegame.TUTORIAL:
+            self.gamestate.set_state_tutorial()
+        elif screen == savegame.LOST:
+            self.gamestate.set_state_game_over()
+        elif screen == savegame.WON:
+            self.gamestate.set_state_game_won()
+        else:
+            self.gamestate.set_state_game()
+        self.gameclock.resume(elapsed, started)
+
+    def close(self):
+        """finishes the recording of the current game
+        """
+        if self.tiles.recorder is not None:
+            self.tiles.recorder.close()
+        if self.tiles.three_bv is not None:
+            self.tiles.three_bv.cancel()
+
+class TileSprites(object):
+    """ keeps a picture of every way a tile can look, so drawing a tile is a single blit
     """
-    def create_initial_state(self):
-        """sets the tiles to the base values and can be altered later
-        """
-        state = []
-        for row in range(Tiles.num_rows):
-            row_state = []
-            for column in range(Tiles.num_columns):
-                tile = {
-                    'covered': True,
-                    'mine': False,
-                    'flagged': False,
-                    'adjacent_mines': 0
-                }
-                row_state.append(tile)
-            state.append(row_state)
-
-        return state
-
-    def calculate_adjacent_mines(self):
-        """Calculate and store the number of adjacent mines for each tile
-        """
-        for row in range(Tiles.num_rows):
-            for column in range(Tiles.num_columns):
-                tile = self.tile_state[row][column]
-                if not tile['mine']:
-                    adjacent_mines = 0
-                    for dx in range(-1, 2):
-                        for dy in range(-1, 2):
-                            if dx == 0 and dy == 0:
-                                continue
-                            new_row = row + dx
-                            new_column = column + dy
-                            if (
-                                new_row >= 0 and new_row < Tiles.num_rows
-                                and new_column >= 0 and new_column < Tiles.num_columns
-                                and self.tile_state[new_row][new_column]['mine']
-                            ):
-                                adjacent_mines += 1
-                    tile['adjacent_mines'] = adjacent_mines
-
-    def place_mines(self):
-        """places mines until it reaches the specified number of mines
-        """
-        num_mines = 40
-        while num_mines >0:
-            row = random.randint(0, self.num_rows - 1)
-            column = random.randint(0, self.num_columns - 1)
-            if not self.tile_state[row][column]['mine']:
-                self.tile_state[row][column]['mine'] = True
-                num_mines -=1
+    def __init__(self, assets, tile_size, gap):
+        self.assets = assets
+        self.tile_size = tile_size
+        self.gap = gap
+        self.sprites = {}
+
+    def get(self, cell, last_column, last_row):
+        """returns the sprite for a packed board cell, it is drawn the first time it is needed.
+        covered tiles on the last row or column have no white edge on that side
+        """
+        if cell & COVERED:
+            key = (cell & (COVERED | FLAGGED), last_column, last_row)
+        elif cell & MINE:
+            key = (MINE, False, False)
+        else:
+            key = (cell & ADJACENT, False, False)
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            sprite = self.sprites[key] = self.render(*key)
+        return sprite
+
+    def hint(self, probability):
+        """returns the overlay drawn on a covered tile to show its chance of being a mine, green
+        for safe, red for a mine and the percentage in between
+        """
+        percent = round(probability * 100)
+        if percent == 0 and probability > 0:
+            percent = 1
+        elif percent == 100 and probability < 1:
+            percent = 99
+        key = ('hint', percent)
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            size = self.tile_size
+            sprite = pygame.Surface((size, size), pygame.SRCALPHA)
+            if percent == 0:
+                sprite.fill(Color.GREEN + (90,))
+            elif percent == 100:
+                sprite.fill(Color.RED + (90,))
+            else:
+                text = self.assets.font(max(20 * size // Tiles.TILE_SIZE, 1)).render(f"{percent}%", True, Color.BLACK)
+                sprite.blit(text, text.get_rect(center=(size // 2, size // 2)))
+            self.sprites[key] = sprite
+        return sprite
+
+    def render(self, cell, last_column, last_row):
+        """draws a tile onto a new surface, the surface includes the gap to the right and below
+        the tile because the white edges of a covered tile are drawn into it
+        """
+        size = self.tile_size
+        sprite = pygame.Surface((size + self.gap, size + self.gap)).convert()
+        sprite.fill(Color.BACKGROUND)
+
+        if cell & COVERED:
+            border_width = 2
+            pygame.draw.rect(sprite, Color.GRAY, (0, 0, size, size))
+            if not last_column:
+                pygame.draw.line(sprite, Color.WHITE, (size, 0), (size, size), border_width)
+            if not last_row:
+                pygame.draw.line(sprite, Color.WHITE, (0, size), (size, size), border_width)
+            pygame.draw.line(sprite, Color.DARK_GRAY, (0, 0), (size, 0), border_width)
+            pygame.draw.line(sprite, Color.DARK_GRAY, (0, 0), (0, size), border_width)
+            if cell & FLAGGED:
+                sprite.blit(self.assets.image('flag.png', (size, size)), (0, 0))
+            return sprite
+
+        pygame.draw.rect(sprite, Color.DARK_GRAY, (0, 0, size, size), 1)
+        if cell & MINE:
+            sprite.blit(self.assets.image('mine.png', (size, size)), (0, 0))
+        elif cell >= 1:
+            text = self.assets.font(max(30 * size // Tiles.TILE_SIZE, 1)).render(str(cell), True, Color.NUMBERS[cell])
+            sprite.blit(text, text.get_rect(center=(size // 2, size // 2)))
+        return sprite
 
 class Tiles(object):
-    """handles the game tiles
+    """handles drawing the game tiles and turning clicks into moves on the board
     """
-    num_rows = 16
-    num_columns = 16
+    # check the board counters against a full recount after every move
+    debug = False
+
     TILE_SIZE = 52
     GAP = 3
     BUFFER = 5
 
-    def __init__(self, game):
-        """ initialises the Tiles class and sets variables for use later
+    # the tile sizes zooming steps through
+    ZOOM_SIZES = (8, 12, 16, 24, 32, 42, 52, 64, 80)
+
+    def __init__(self, game, board=None):
+        """ initialises the Tiles class and sets variables for use later, board is only given
+        for a board that was not made here, like a replay or a saved game
         """
         self.game = game
-        self.tile_state = Tile.create_initial_state(self)
-        Tile.place_mines(self)
-        Tile.calculate_adjacent_mines(self)
-        self.flag_image = pygame.image.load('flag.png')
-        self.flag_image = pygame.transform.scale(pygame.image.load('flag.png'), (self.TILE_SIZE, self.TILE_SIZE))
-        self.mine_image = pygame.image.load('mine.png')
-        self.mine_image = pygame.transform.scale(pygame.image.load('mine.png'), (self.TILE_SIZE, self.TILE_SIZE))
-        self.num_flags = 0
-
-    def uncover(self, pos):
-        """ uncovers tiles when they are clicked and check for win or lose conditions when the tiles are uncovered
-        """
-        for row in range(self.num_rows):
-            for column in range(self.num_columns):
-                x = column * (self.TILE_SIZE + self.GAP) + self.BUFFER
-                y = row * (self.TILE_SIZE + self.GAP)
-                rect = pygame.Rect(x, y, self.TILE_SIZE, self.TILE_SIZE)
-                if rect.collidepoint(pos):
-                    if self.tile_state[row][column]['flagged']:
-                        return
-                    tile = self.tile_state[row][column]
-                    if tile['covered']:
-                        tile['covered'] = False
-                        if tile['mine']:
-                            game.gamestate.set_state_game_over()
-                            self.reveal_board()
-                        else:
-                            count = 0
-                            for r in range(row - 1, row + 2):
-                                for c in range(column - 1, column + 2):
-                                    if (
-                                        0 <= r < self.num_rows
-                                        and 0 <= c < self.num_columns
-                                        and self.tile_state[r][c]['mine']
-                                    ):
-                                        count += 1
-                            tile['adjacent_mines'] = count
-
-                            num_covered_non_mines = sum(
-                                sum(1 for tile in row if tile['covered'] and not tile['mine'])
-                                for row in self.tile_state
-                            )
-                            if num_covered_non_mines == 0:
-                                game.gamestate.set_state_game_won()
-                                self.draw()
-                            if tile['adjacent_mines'] == 0:
-                                self.clear_adjacent_tiles(row, column)
-
-    def reveal_board(self):
-        """reveals the mines on the board, is called when a mine is clicked and the game is over
-        """
-        for row in range(self.num_rows):
-            for column in range(self.num_columns):
-                if self.tile_state[row][column]['mine']:
-                    self.tile_state[row][column]['covered'] = False
-
-    def flag(self, pos):
-        """places flags, is called on right click"""
-        for row in range(self.num_rows):
-            for column in range(self.num_columns):
-                x = column * (self.TILE_SIZE + self.GAP) + self.BUFFER
-                y = row * (self.TILE_SIZE + self.GAP)
-                rect = pygame.Rect(x, y, self.TILE_SIZE, self.TILE_SIZE)
-                if rect.collidepoint(pos):
-                    tile = self.tile_state[row][column]
-                    if tile['flagged']:
-                        tile['flagged'] = False 
-                        self.num_flags -= 1
-                    elif tile['covered']:
-                        if self.num_flags < 40:
-                            tile['flagged'] = True
-                            self.num_flags += 1
+        self.num_rows = game.num_rows
+        self.num_columns = game.num_columns
+        start = None
+        # a board from the no-guess pool, None without a pool or when it can't make this size
+        # and a board that may need guessing is played instead
+        pooled = None
+        if board is None and game.board_pool is not None and game.density is None and game.connection is None:
+            pooled = game.board_pool.take(self.num_rows, self.num_columns, game.num_mines)
+        if board is not None:
+            self.board = board
+        elif game.connection is not None:
+            self.board = RemoteBoard.new(game.connection, self.num_rows, self.num_columns, game.num_mines)
+        elif game.density is not None:
+            self.board = ChunkedBoard(self.num_rows, self.num_columns, game.density, chunk_size=game.chunk_size,
+                                      debug=self.debug)
+            # a huge board starts with an opening in the middle already uncovered
+            start = self.board.find_opening(self.num_rows // 2, self.num_columns // 2)
+        elif pooled is not None:
+            seed, start = pooled
+            self.board = Board(self.num_rows, self.num_columns, game.num_mines, seed=seed, debug=self.debug, safe=start)
+        else:
+            self.board = Board(self.num_rows, self.num_columns, game.num_mines, debug=self.debug)
+        self.num_mines = self.board.num_mines
+        gap = self.gap_for(game.tile_size)
+        self.layout = BoardLayout(self.num_rows, self.num_columns, game.tile_size, gap, self.BUFFER,
+                                  game.view_rect.width, game.view_rect.height)
+        self.sprites = assets.tile_sprites(game.tile_size, gap)
+        self.flag_counter = CounterText(game, (30, game.view_rect.height + 5))
+
+        # indexes of the tiles that changed since they were last drawn
+        self.dirty = set()
+
+        # writes the moves to a replay file when the game records games
+        self.recorder = None
+        if game.record_dir is not None and board is None:
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{self.board.seed}.msr"
+            self.recorder = Recorder(os.path.join(game.record_dir, name), self.board)
+
+        # tiles clicked on, for the statistics
+        self.clicks = 0
+
+        # set once the game ended and the clock was stopped for it
+        self.finished = False
+
+        # a future of the 3BV of the board for the statistics, the mines don't move once the
+        # board is made so it is worked out in the background from the start. the 3BV of a
+        # board in chunks would need the whole board
+        self.three_bv = None
+        if game.stats is not None and not isinstance(self.board, (ChunkedBoard, RemoteBoard)):
+            self.three_bv = game.background.submit(three_bv, self.board)
+
+        # the moves played so far for undo and redo, a game on a server can't be undone
+        self.history = None if isinstance(self.board, RemoteBoard) else History(self.board)
+
+        # the solver is only made once hints are shown, analysis is None when it is out of date
+        self.solver = None
+        self.analysis = None
+
+        # indexes of the tiles drawn with a hint on them, and whether hints were on then
+        self.hinted = set()
+        self.hints_shown = False
+
+        # a no-guess board starts with its start tile open so the player knows where to begin.
+        # the opening is not a move that can be undone, and when it already wins the game
+        # nothing was played so the game isn't timed or added to the statistics
+        if start is not None:
+            self.layout.center_on(*start)
+            self.dirty.update(self.board.uncover(*start))
+            if self.recorder is not None:
+                self.recorder.uncover(*start)
+            self.finished = self.board.game_won
+
+    @classmethod
+    def gap_for(cls, tile_size):
+        """returns the gap between tiles of tile_size, it shrinks with the tiles
+        """
+        return max(cls.GAP * tile_size // cls.TILE_SIZE, 1)
 
-    def draw(self):
-        """ this draws all of the tiles, also draws the updated versions such as when the uncover or flag funtions are called
+    def zoom(self, tile_size, anchor):
+        gap = self.gap_for(tile_size)
+        self.layout.zoom(tile_size, gap, anchor)
+        self.sprites = assets.tile_sprites(tile_size, gap)
+
+    @property
+    def num_flags(self):
+        return self.board.num_flags
+
+    def uncover(self, row, column):
+        """ uncovers the clicked tile and updates the game state when the game is won or lost
         """
-        for row in range(self.num_rows):
-            for column in range(self.num_columns):
-                x = column * (self.TILE_SIZE + self.GAP) + self.BUFFER
-                y = row * (self.TILE_SIZE + self.GAP)
-                tile = self.tile_state[row][column]
+        if self.history is not None:
+            self.uncovered(self.history.uncover(row, column))
+        else:
+            self.uncovered(self.board.uncover(row, column))
 
-                if tile['covered']:
-                    color = Color.GRAY
-                else:
-                    color = Color.BACKGROUND
-
-                pygame.draw.rect(self.game.win, color, (x, y, self.TILE_SIZE, self.TILE_SIZE))
-
-                if not tile['covered']:
-                    border_color = (Color.DARK_GRAY)
-                    border_width = 1
-                    pygame.draw.rect(self.game.win, border_color, (x, y, self.TILE_SIZE, self.TILE_SIZE), border_width)
-
-                if tile['covered']:
-                    border_width = 2
-                    if column < self.num_columns - 1:
-                        pygame.draw.line(self.game.win, Color.WHITE, (x + self.TILE_SIZE, y), (x + self.TILE_SIZE, y + self.TILE_SIZE), border_width)
-                    if row < self.num_rows - 1:
-                        pygame.draw.line(self.game.win, Color.WHITE, (x, y + self.TILE_SIZE), (x + self.TILE_SIZE, y + self.TILE_SIZE), border_width)
-                    pygame.draw.line(self.game.win, Color.DARK_GRAY, (x, y), (x + self.TILE_SIZE, y), border_width)
-                    pygame.draw.line(self.game.win, Color.DARK_GRAY, (x, y), (x, y + self.TILE_SIZE), border_width)
-
-                if not tile['covered'] and tile['mine']:
-                    self.draw_mine(x, y)
-
-                if not tile['covered'] and not tile['mine'] and tile['adjacent_mines'] >= 1:
-                    adjacent_mines = tile['adjacent_mines']
-                    font = pygame.font.Font(None, 30)
-
-                    if adjacent_mines == 1:
-                        text_color = Color.BLUE
-                    elif adjacent_mines == 2:
-                        text_color = Color.GREEN
-                    elif adjacent_mines == 3:
-                        text_color = Color.RED
-                    elif adjacent_mines == 4:
-                        text_color = Color.DARK_BLUE
-                    elif adjacent_mines == 5:
-                        text_color = Color.MAROON
-                    elif adjacent_mines == 6:
-                        text_color = Color.TURQUOISE
-                    elif adjacent_mines == 7:
-                        text_color = Color.BLACK
-                    elif adjacent_mines == 8:
-                        text_color = Color.GRAY
-
-                    text = font.render(str(adjacent_mines), True, text_color)
-                    text_rect = text.get_rect(center=(x + self.TILE_SIZE // 2, y + self.TILE_SIZE // 2))
-                    self.game.win.blit(text, text_rect)
-
-                if tile['flagged']:
-                    self.draw_flag(x, y)
-
-        font = pygame.font.SysFont(None, 36)
-        flag_text = font.render(f"Flags: {40 - self.num_flags}", True, Color.RED)
-        self.game.win.blit(flag_text, (30, 885))
-
-    def draw_flag(self, x, y):
-        """draws flags
-        """
-        self.game.win.blit(self.flag_image, (x, y))
-
-    def draw_mine(self, x, y):
-        """draws mines
-        """
-        self.game.win.blit(self.mine_image, (x, y))
+    def uncovered(self, revealed):
+        """ updates the drawing, the hints and the game state after tiles were uncovered
+        """
+        self.dirty.update(revealed)
+        if self.solver is not None:
+            self.solver.update(revealed)
+        self.analysis = None
+        if self.board.game_over:
+            self.game.gamestate.set_state_game_over()
+            self.game.finished()
+        elif self.board.game_won:
+            self.game.gamestate.set_state_game_won()
+            self.game.finished()
+
+    def board_changed(self):
+        """ starts over with the hints and the game state and draws everything again, for when
+        the board was changed behind the tiles' back, like seeking in a replay
+        """
+        self.game.screen = None
+        self.changed(())
+
+    def changed(self, tiles):
+        """ draws tiles again and starts over with the hints and the game state after moves were
+        taken back or played again
+        """
+        self.dirty.update(tiles)
+        self.solver = None
+        self.analysis = None
+        if self.board.game_over:
+            self.game.gamestate.set_state_game_over()
+            self.game.finished()
+        elif self.board.game_won:
+            self.game.gamestate.set_state_game_won()
+            self.game.finished()
+        else:
+            self.game.gamestate.set_state_game()
+
+    def flag(self, row, column):
+        """places flags, is called on right click"""
+        if self.history is not None:
+            self.history.flag(row, column)
+        else:
+            self.board.flag(row, column)
+        self.dirty.add(self.board.index(row, column))
+
+    def undo(self):
+        """ takes back the last move. replays can only go forward, so a game stops being
+        recorded once a move is undone
+        """
+        if self.history is None or not self.history.can_undo():
+            return
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+        self.changed(self.history.undo())
+
+    def redo(self):
+        if self.history is None or not self.history.can_redo():
+            return
+        self.changed(self.history.redo())
+
+    def update_hints(self):
+        """works out which tiles need a hint and marks the ones that changed to be drawn again
+        """
+        hinted = set()
+        self.hints_shown = self.game.show_hints
+        if self.game.show_hints and not self.board.game_over and not self.board.game_won:
+            if self.analysis is None:
+                if self.solver is None:
+                    self.solver = Solver(self.board)
+                self.analysis = self.solver.solve()
+            hinted = self.analysis.safe | self.analysis.mines | set(self.analysis.probabilities)
+        self.dirty |= self.hinted | hinted
+        self.hinted = hinted
+
+    def draw(self, full=False):
+        """ draws the tiles that changed since the last call, or all of them when full is set,
+        and the flag counter. returns the areas of the window that were drawn
+        """
+        rows, columns = self.layout.visible_range()
+        # the openings of a chunked board spread into the chunks as they come into view
+        if isinstance(self.board, ChunkedBoard):
+            revealed = self.board.expand(rows, columns)
+            if revealed:
+                self.uncovered(revealed)
+        if self.analysis is None or self.hints_shown != self.game.show_hints:
+            self.update_hints()
+        # only the tiles in the view are drawn, the others are drawn when it is scrolled to them
+        num_columns = self.num_columns
+        if full:
+            tiles = [row * num_columns + column for row in rows for column in columns]
+        else:
+            tiles = [i for i in self.dirty if i // num_columns in rows and i % num_columns in columns]
+        cells = self.board.cells
+        last_row = self.num_rows - 1
+        last_column = num_columns - 1
+        rects = []
+        win = self.game.win
+        win.set_clip(self.game.view_rect)
+        for i in tiles:
+            row, column = divmod(i, num_columns)
+            position = self.layout.tile_position(row, column)
+            sprite = self.sprites.get(cells[i], column == last_column, row == last_row)
+            rects.append(win.blit(sprite, position))
+            if i in self.hinted:
+                win.blit(self.sprites.hint(self.analysis.probability(i)), position)
+        win.set_clip(None)
+        self.dirty = set()
+        if self.game.profiler is not None:
+            self.game.profiler.count_tiles(len(tiles))
+
+        if full:
+            rects = []
+        rects.extend(self.flag_counter.draw(f"Flags: {self.board.mines_remaining}", full))
+        return rects
 
     def collidepoint(self, pos):
         """detects where a tile is and relays to use when detecting clicks
         """
-        for row in range(self.num_rows):
-            for column in range(self.num_columns):
-                x = column * (self.TILE_SIZE + self.GAP) + self.BUFFER
-                y = row * (self.TILE_SIZE + self.GAP)
-                rect = pygame.Rect(x, y, self.TILE_SIZE, self.TILE_SIZE)
-                if rect.collidepoint(pos):
-                    return True
-        return False
-
-    def clear_adjacent_tiles(self, row, column):
-        """this clears tiles that are adjacent to tiles with 0 adjacent mines
-        """
-        for r in range(row - 1, row + 2):
-            for c in range(column - 1, column + 2):
-                if (
-                    0 <= r < self.num_rows
-                    and 0 <= c < self.num_columns
-                    and self.tile_state[r][c]['covered']
-                ):
-                    self.tile_state[r][c]['covered'] = False
-                    self.tile_state[r][c]['flagged'] = False
-                    if self.tile_state[r][c]['adjacent_mines'] == 0:
-                        self.clear_adjacent_tiles(r, c)
-
-pygame.init()
-
-pygame.display.set_caption("Minesweeper")
-
-# Create the game instance
-game = Game()
-
-# Start the game loop
-game.loop()
-
-# Quit Pygame
-pygame.quit()
\ No newline at end of file
+        return self.layout.cell_at(pos) is not None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Minesweeper")
+    parser.add_argument('--fps', type=int, default=60, help='frame rate cap, 0 for no cap')
+    parser.add_argument('--busy-loop', action='store_true',
+                        help='keep drawing frames while nothing happens instead of waiting for events')
+    parser.add_argument('--no-guess', action='store_true',
+                        help='only play boards that can be solved without guessing')
+    parser.add_argument('--pool-size', type=int, default=4, help='no-guess boards to keep ready')
+    parser.add_argument('--pool-file', default=None, help='file to keep unused no-guess boards in between runs')
+    parser.add_argument('--rows', type=int, default=16)
+    parser.add_argument('--columns', type=int, default=16)
+    parser.add_argument('--mines', type=int, default=40)
+    parser.add_argument('--density', type=float, default=None,
+                        help='fraction of tiles that are mines, generates the board in chunks as it is explored. '
+                             f'at least {MIN_DENSITY}, boards with more than {Game.CHUNKED_TILES} tiles need it')
+    parser.add_argument('--chunk-size', type=int, default=64, help='rows and columns in a chunk of a chunked board')
+    parser.add_argument('--save-file', default='minesweeper.sav', help='file F5 saves the game to and F9 loads it from')
+    parser.add_argument('--load', action='store_true', help='carry on with the game in --save-file')
+    parser.add_argument('--record', default=None, metavar='DIRECTORY',
+                        help='record every game as a replay file in DIRECTORY, see replay.py')
+    parser.add_argument('--profile', action='store_true', help='show the frame timings from the start, F3 toggles them')
+    parser.add_argument('--metrics', default=None, metavar='FILE',
+                        help='append samples of the frame timings to FILE as JSON lines, see profiler.py')
+    parser.add_argument('--stats-file', default='minesweeper.db',
+                        help='SQLite database every finished game is added to, see stats.py')
+    parser.add_argument('--no-stats', action='store_true', help="don't keep statistics")
+    parser.add_argument('--connect', default=None, metavar='ADDRESS',
+                        help='play on the server at HOST:PORT or unix:PATH, see server.py')
+    parser.add_argument('--session', default=None, help='carry on with this session on the --connect server')
+    parser.add_argument('--metrics-interval', type=float, default=1.0, help='seconds between samples in --metrics')
+    args = parser.parse_args()
+    if args.rows < 1 or args.columns < 1:
+        parser.error("--rows and --columns must be at least 1")
+    if args.density is None and not 0 <= args.mines <= args.rows * args.columns:
+        parser.error(f"--mines must be from 0 to {args.rows * args.columns} on a {args.rows}x{args.columns} board")
+    if args.no_guess and args.mines >= args.rows * args.columns:
+        parser.error("--no-guess needs a tile without a mine to start from")
+    if args.density is None and args.rows * args.columns > Game.CHUNKED_TILES:
+        parser.error(f"boards with more than {Game.CHUNKED_TILES} tiles are generated in chunks and need --density")
+    if args.density is not None and not MIN_DENSITY <= args.density < 1:
+        parser.error(f"--density must be at least {MIN_DENSITY} and below 1")
+    if args.no_guess and (args.density is not None or args.rows * args.columns > Game.CHUNKED_TILES):
+        parser.error("--no-guess can't be used with boards generated in chunks")
+    if args.connect is not None and (args.no_guess or args.density is not None or args.record is not None
+                                     or args.load):
+        parser.error("--connect can't be used with --no-guess, --density, --record or --load")
+    if args.session is not None and args.connect is None:
+        parser.error("--session needs --connect")
+
+    if args.record is not None:
+        os.makedirs(args.record, exist_ok=True)
+
+    board_pool = None
+    if args.no_guess:
+        board_pool = BoardPool(size=args.pool_size, path=args.pool_file)
+        board_pool.fill(args.rows, args.columns, args.mines)
+
+    stats = None
+    if not args.no_stats:
+        stats = Stats(args.stats_file)
+
+    connection = None
+    if args.connect is not None:
+        connection = Connection(args.connect)
+
+    pygame.init()
+
+    pygame.display.set_caption("Minesweeper")
+
+    # Create the game instance
+    game = Game(fps=args.fps, wait_when_idle=not args.busy_loop, board_pool=board_pool, num_rows=args.rows,
+                num_columns=args.columns, num_mines=args.mines, density=args.density, chunk_size=args.chunk_size,
+                record_dir=args.record, save_path=None if connection else args.save_file,
+                metrics_path=args.metrics, metrics_interval=args.metrics_interval, connection=connection,
+                stats=stats)
+    if args.load:
+        game.load()
+    if args.session is not None:
+        game.attach(args.session)
+    if args.profile:
+        game.toggle_profiler()
+
+    # Start the game loop
+    game.loop()
+    game.close()
+    game.background.shutdown(cancel_futures=True)
+    if game.profiler is not None:
+        game.profiler.close()
+
+    # Quit Pygame
+    pygame.quit()
+
+    if board_pool is not None:
+        board_pool.close()
+    if connection is not None:
+        connection.close()
+    if stats is not None:
+        stats.close()
+
+
+if __name__ == '__main__':
+    main()
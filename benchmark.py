@@ -0,0 +1,540 @@
+""" benchmarks for the board engine, run `python benchmark.py --help` to see the benchmarks
+
+every benchmark prints its results and can also write them as JSON with --output. with
+--baseline the results are compared against an earlier --output, and the exit status is 1
+when a result got worse by more than --tolerance, so
+
+    python benchmark.py suite --sizes 16 256 1024 --baseline benchmark_baseline.json
+
+checks generation, reveals, clicks and frames for regressions against the stored baseline,
+which was made with the same options and --output. the baseline only means something on the
+machine it was made on, make a new one before comparing on another. the pygame benchmarks use the
+SDL dummy video driver so they run without a display.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+
+from board import Board, COVERED, MINE
+from chunked import ChunkedBoard
+import savegame
+
+
+def record(args, name, value, unit):
+    """adds a result for --output and --baseline, units ending in /s are better when higher
+    and every other unit is better when lower
+    """
+    args.results.append({'name': name, 'value': value, 'unit': unit})
+
+
+def best_of(repeat, function):
+    """returns the fewest seconds function took over repeat calls
+    """
+    best = None
+    for attempt in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds = time.perf_counter() - start
+        if best is None or seconds < best:
+            best = seconds
+    return best
+
+
+def measure(function):
+    """runs function once and returns (result, seconds, bytes allocated)
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function()
+    seconds = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, seconds, size
+
+
+def dict_layout(num_rows, num_columns):
+    """builds the list of dicts tile state that the game used before the packed board
+    """
+    return [
+        [{'covered': True, 'mine': False, 'flagged': False, 'adjacent_mines': 0} for column in range(num_columns)]
+        for row in range(num_rows)
+    ]
+
+
+def packed_layout(num_rows, num_columns):
+    return bytearray([COVERED]) * (num_rows * num_columns)
+
+
+def bench_layout(args):
+    """compares memory and scan time of the dict layout and the packed layout
+    """
+    for size in args.sizes:
+        cells = size * size
+        if cells <= args.max_dict_cells:
+            state, build, memory = measure(lambda: dict_layout(size, size))
+            start = time.perf_counter()
+            sum(1 for row in state for tile in row if tile['covered'] and not tile['mine'])
+            scan = time.perf_counter() - start
+            del state
+            estimated = ''
+        else:
+            # a board this big would need gigabytes, so scale up the cost of a smaller one
+            sample = 256
+            state, build, memory = measure(lambda: dict_layout(sample, sample))
+            start = time.perf_counter()
+            sum(1 for row in state for tile in row if tile['covered'] and not tile['mine'])
+            scan = time.perf_counter() - start
+            del state
+            scale = cells / (sample * sample)
+            build, memory, scan = build * scale, memory * scale, scan * scale
+            estimated = ' (estimated)'
+        print(f"dict   {size}x{size}: {memory / cells:7.1f} B/tile {memory / 2**20:10.1f} MiB "
+              f"build {build * 1000:9.1f} ms scan {scan * 1000:9.1f} ms{estimated}")
+        record(args, f"layout.dict.{size}x{size}.memory", memory / 2**20, 'MiB')
+
+        state, build, memory = measure(lambda: packed_layout(size, size))
+        start = time.perf_counter()
+        sum(1 for cell in state if cell & (COVERED | MINE) == COVERED)
+        scan = time.perf_counter() - start
+        print(f"packed {size}x{size}: {memory / cells:7.1f} B/tile {memory / 2**20:10.1f} MiB "
+              f"build {build * 1000:9.1f} ms scan {scan * 1000:9.1f} ms")
+        record(args, f"layout.packed.{size}x{size}.memory", memory / 2**20, 'MiB')
+
+
+def bench_generate(args):
+    """times Board creation, which places the mines and counts adjacent mines
+    """
+    for size in args.sizes:
+        for density in args.densities:
+            num_mines = int(size * size * density)
+            seconds = best_of(args.repeat, lambda: Board(size, size, num_mines, seed=args.seed))
+            print(f"generate {size}x{size} {num_mines} mines ({density:.0%}): {seconds * 1000:9.1f} ms")
+            record(args, f"generate.{size}x{size}.{density:.0%}", seconds * 1000, 'ms')
+
+
+def bench_reveal(args):
+    """stress test for the flood reveal, uncovers one corner of a board without mines so
+    every tile is revealed in a single click
+    """
+    for size in args.sizes:
+        seconds = None
+        for attempt in range(args.repeat):
+            board = Board(size, size, 0, seed=args.seed)
+            start = time.perf_counter()
+            revealed = board.uncover(0, 0)
+            took = time.perf_counter() - start
+            assert len(revealed) == size * size and board.game_won
+            del revealed
+            if seconds is None or took < seconds:
+                seconds = took
+
+        # tracemalloc slows the reveal down a lot, so memory is measured on a second run
+        board = Board(size, size, 0, seed=args.seed)
+        tracemalloc.start()
+        board.uncover(0, 0)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"reveal {size}x{size}: {seconds * 1000:9.1f} ms {peak / 2**20:7.1f} MiB peak")
+        record(args, f"reveal.{size}x{size}", seconds * 1000, 'ms')
+        record(args, f"reveal.{size}x{size}.peak", peak / 2**20, 'MiB')
+
+
+def bench_chunked(args):
+    """explores a board of a million by a million tiles one chunk at a time, memory should
+    grow with the chunks touched and not with the board
+    """
+    for touched in (1, 10, 100):
+        board = ChunkedBoard(10 ** 6, 10 ** 6, args.densities[0], seed=args.seed)
+        tiles = random.Random(args.seed)
+        start = time.perf_counter()
+        while len(board.chunks) < touched:
+            board.cells[tiles.randrange(len(board.cells))]
+        seconds = time.perf_counter() - start
+
+        # tracemalloc slows making chunks down a lot, so memory is measured on a second run
+        board = ChunkedBoard(10 ** 6, 10 ** 6, args.densities[0], seed=args.seed)
+        tiles = random.Random(args.seed)
+        tracemalloc.start()
+        while len(board.chunks) < touched:
+            board.cells[tiles.randrange(len(board.cells))]
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f"chunked {touched:5} chunks: {seconds * 1000:9.1f} ms {size / 2**20:7.2f} MiB")
+        record(args, f"chunked.{touched}", seconds * 1000, 'ms')
+        record(args, f"chunked.{touched}.memory", size / 2**20, 'MiB')
+
+
+def bench_env(args):
+    """steps batches of 16x16 boards with 40 mines through env.BatchEnv with random moves, the
+    moves are made before the clock starts so only the environment is timed
+    """
+    from env import BatchEnv, UNCOVER, FLAG
+
+    for num_boards in (1, 64, 1024):
+        env = BatchEnv(num_boards, 16, 16, 40, seed=args.seed)
+        rng = random.Random(args.seed)
+        steps = max(100000 // num_boards, 10)
+        batches = [[(b, rng.randrange(16), rng.randrange(16), FLAG if rng.random() < 0.1 else UNCOVER)
+                    for b in range(num_boards)] for step in range(steps)]
+        start = time.perf_counter()
+        for moves in batches:
+            env.step(moves)
+        seconds = time.perf_counter() - start
+        rate = steps * num_boards / seconds
+        print(f"env {num_boards:5} boards: {rate:12,.0f} board-steps/s, {env.games} games finished")
+        record(args, f"env.{num_boards}", rate, 'board-steps/s')
+
+
+def bench_stats(args):
+    """fills a statistics database with a million games on a few kinds of board and times the
+    queries the leaderboard makes
+    """
+    import tempfile
+    from stats import Stats
+
+    kinds = [(9, 9, 10, 0), (16, 16, 40, 0), (16, 30, 99, 0), (16, 16, 40, 1)]
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        stats = Stats(os.path.join(directory, 'stats.db'))
+        with stats.connection:
+            stats.connection.executemany(
+                "INSERT INTO games (finished, num_rows, num_columns, num_mines, no_guess, seed, milliseconds,"
+                " clicks, three_bv, won) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                ((0.0, *kinds[n % len(kinds)], n, rng.randrange(1000, 600000), 100, 50, rng.random() < 0.4)
+                 for n in range(10 ** 6)))
+        kind = kinds[1]
+        queries = {
+            'best': lambda: stats.best_times(kind),
+            'counts': lambda: stats.counts(kind),
+            'median': lambda: stats.percentile(kind, 0.5),
+            'rank': lambda: stats.rank(kind, 60000),
+        }
+        for name, query in queries.items():
+            seconds = best_of(args.repeat, query)
+            print(f"stats {name:6} over 1000000 games: {seconds * 1000:9.3f} ms")
+            record(args, f"stats.{name}", seconds * 1000, 'ms')
+        stats.close()
+
+
+def bench_save(args):
+    """compares file size and load time of savegame against a JSON dump of the old dict
+    tile state, big boards are memory-mapped so loading them only reads what is looked at
+    """
+    path = 'benchmark.sav'
+    try:
+        for size in args.sizes:
+            board = Board(size, size, int(size * size * args.densities[0]), seed=args.seed)
+            board.uncover(size // 2, size // 2)
+            start = time.perf_counter()
+            savegame.save(path, board)
+            save = time.perf_counter() - start
+            start = time.perf_counter()
+            loaded = savegame.load(path)[0]
+            load = time.perf_counter() - start
+            # reading a tile decodes its chunk when the board was memory-mapped
+            loaded.cells[0]
+            first = time.perf_counter() - start
+            print(f"save {size}x{size}: {os.path.getsize(path) / 1024:10.1f} KiB save {save * 1000:9.1f} ms "
+                  f"load {load * 1000:9.1f} ms first tile {first * 1000:9.1f} ms")
+            record(args, f"save.{size}x{size}.size", os.path.getsize(path) / 1024, 'KiB')
+            record(args, f"save.{size}x{size}.save", save * 1000, 'ms')
+            record(args, f"save.{size}x{size}.load", first * 1000, 'ms')
+
+            if size * size > args.max_dict_cells:
+                continue
+            state = dict_layout(size, size)
+            start = time.perf_counter()
+            with open(path, 'w') as file:
+                json.dump(state, file)
+            save = time.perf_counter() - start
+            del state
+            start = time.perf_counter()
+            with open(path) as file:
+                json.load(file)
+            load = time.perf_counter() - start
+            print(f"json {size}x{size}: {os.path.getsize(path) / 1024:10.1f} KiB save {save * 1000:9.1f} ms "
+                  f"load {load * 1000:9.1f} ms")
+            record(args, f"save.json.{size}x{size}.size", os.path.getsize(path) / 1024, 'KiB')
+            record(args, f"save.json.{size}x{size}.load", load * 1000, 'ms')
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def timed_frames(frames, function, repeat=1):
+    """calls function frames times, repeat times over, and returns the wall and cpu
+    milliseconds per call of the fastest run
+    """
+    best = None
+    for attempt in range(repeat):
+        start = time.perf_counter()
+        cpu = time.process_time()
+        for frame in range(frames):
+            function(frame)
+        wall = (time.perf_counter() - start) * 1000 / frames
+        cpu = (time.process_time() - cpu) * 1000 / frames
+        if best is None or wall < best[0]:
+            best = wall, cpu
+    return best
+
+
+def bench_frame(args):
+    """times drawing and presenting frames with the SDL dummy video driver. 'full' draws every
+    tile each frame like the game used to, 'idle' and 'flag' use the dirty rectangle renderer
+    """
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    import pygame
+    import Minesweeper
+
+    pygame.init()
+    game = Minesweeper.Game()
+    game.gamestate.set_state_game()
+    game.present(full=True)
+    rng = random.Random(args.seed)
+    tiles = game.tiles
+
+    def flag(frame):
+        tiles.flag(rng.randrange(tiles.num_rows), rng.randrange(tiles.num_columns))
+        game.present()
+
+    results = {
+        'full': timed_frames(args.frames, lambda frame: game.present(full=True), args.repeat),
+        'idle': timed_frames(args.frames, lambda frame: game.present(), args.repeat),
+        'flag': timed_frames(args.frames, flag, args.repeat),
+    }
+    for name, (wall, cpu) in results.items():
+        print(f"frame {name:5} {tiles.num_rows}x{tiles.num_columns}: {wall:7.3f} ms wall {cpu:7.3f} ms cpu")
+        record(args, f"frame.{name}", wall, 'ms')
+    pygame.quit()
+
+
+def latencies(calls, function, prepare=None, repeat=1):
+    """calls function(n) calls times, repeat times over, and returns the median and 95th
+    percentile milliseconds of the middle run. the runs can click on different boards, so the
+    luckiest one is not used. prepare(n) is called before each call without being timed
+    """
+    medians = []
+    p95s = []
+    for attempt in range(repeat):
+        times = []
+        for n in range(calls):
+            if prepare is not None:
+                prepare(n)
+            start = time.perf_counter()
+            function(n)
+            times.append((time.perf_counter() - start) * 1000)
+        times.sort()
+        medians.append(statistics.median(times))
+        p95s.append(times[int(len(times) * 0.95)])
+    return statistics.median(medians), statistics.median(p95s)
+
+
+def bench_click(args):
+    """times what one click costs on the standard board without drawing: finding the tile
+    under the mouse, uncovering a tile and placing a flag
+    """
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    import pygame
+    import Minesweeper
+
+    pygame.init()
+    game = Minesweeper.Game()
+    game.gamestate.set_state_game()
+    rng = random.Random(args.seed)
+    width, height = game.view_rect.size
+    positions = [(rng.randrange(width), rng.randrange(height)) for n in range(args.frames)]
+    tiles = [(rng.randrange(game.num_rows), rng.randrange(game.num_columns)) for n in range(args.frames)]
+
+    def new_game(n):
+        # every run starts on a new board so the runs click the same way
+        if n == 0 or game.tiles.board.game_over or game.tiles.board.game_won:
+            game.restart()
+
+    results = {
+        'collidepoint': latencies(args.frames, lambda n: game.tiles.collidepoint(positions[n]), repeat=args.repeat),
+        'cell_at': latencies(args.frames, lambda n: game.tiles.layout.cell_at(positions[n]), repeat=args.repeat),
+        'uncover': latencies(args.frames, lambda n: game.tiles.uncover(*tiles[n]), new_game, args.repeat),
+        'flag': latencies(args.frames, lambda n: game.tiles.flag(*tiles[n]), repeat=args.repeat),
+    }
+    for name, (median, p95) in results.items():
+        print(f"click {name:12}: {median:8.4f} ms median {p95:8.4f} ms 95th percentile")
+        record(args, f"click.{name}", median, 'ms')
+        record(args, f"click.{name}.p95", p95, 'ms')
+    pygame.quit()
+
+
+def bench_loop(args):
+    """measures the cpu use of Game.loop on the tutorial screen, while playing with the clock
+    running and the mouse moving, and after the game is lost, with the old busy loop and with
+    the capped loop that waits for events
+    """
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    import pygame
+    import Minesweeper
+
+    pygame.init()
+    modes = {
+        'busy': {'fps': 0, 'wait_when_idle': False},
+        'capped': {'fps': args.fps, 'wait_when_idle': True},
+    }
+    for mode, options in modes.items():
+        for state in ('tutorial', 'playing', 'game_over'):
+            game = Minesweeper.Game(**options)
+            if state == 'playing':
+                game.gamestate.set_state_game()
+                game.gameclock.start()
+            elif state == 'game_over':
+                game.gamestate.set_state_game_over()
+
+            def post_events():
+                end = time.perf_counter() + args.seconds
+                while time.perf_counter() < end:
+                    if state == 'playing':
+                        pygame.event.post(pygame.event.Event(pygame.MOUSEMOTION, pos=(100, 100), rel=(1, 0), buttons=(0, 0, 0)))
+                    time.sleep(0.01)
+                pygame.event.post(pygame.event.Event(pygame.QUIT))
+
+            poster = threading.Thread(target=post_events)
+            start = time.perf_counter()
+            cpu = time.process_time()
+            poster.start()
+            game.loop()
+            poster.join()
+            percent = (time.process_time() - cpu) / (time.perf_counter() - start) * 100
+            print(f"loop {mode:6} {state:9}: {percent:5.1f}% cpu")
+            record(args, f"loop.{mode}.{state}", percent, '%')
+    pygame.quit()
+
+
+def bench_startup(args):
+    """times starting the game up to its first frame, and restarting it up to the next frame
+    """
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    start = time.perf_counter()
+    import pygame
+    import Minesweeper
+
+    pygame.init()
+    game = Minesweeper.Game()
+    game.gamestate.set_state_game()
+    game.present()
+    startup = time.perf_counter() - start
+
+    restart = timed_frames(args.frames, lambda frame: (game.restart(), game.present()))[0]
+    print(f"startup: {startup * 1000:7.1f} ms")
+    print(f"restart: {restart:7.3f} ms")
+    record(args, 'startup', startup * 1000, 'ms')
+    record(args, 'restart', restart, 'ms')
+    pygame.quit()
+
+
+def bench_suite(args):
+    """runs the benchmarks for the paths every game goes through: generation, reveals, clicks
+    and frames
+    """
+    for name in ('generate', 'reveal', 'click', 'frame'):
+        BENCHMARKS[name](args)
+
+
+def compare(results, baseline, tolerance, noise_floor=0.0):
+    """prints how every result changed against the baseline and returns the names of the
+    ones that got worse by more than tolerance. timings that changed by less than noise_floor
+    milliseconds are never counted, the clock, the interpreter and the machine add tens of
+    microseconds of jitter to any call
+    """
+    before = {result['name']: result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        old = before.get(result['name'])
+        if old is None or old['unit'] != result['unit'] or not old['value']:
+            continue
+        change = result['value'] / old['value'] - 1
+        if result['unit'].endswith('/s'):
+            change = -change
+        worse = change > tolerance
+        if result['unit'] == 'ms' and abs(result['value'] - old['value']) < noise_floor:
+            worse = False
+        if worse:
+            regressions.append(result['name'])
+        print(f"{result['name']:40} {old['value']:12.4f} -> {result['value']:12.4f} {result['unit']:4} "
+              f"{change:+7.1%}{'  REGRESSION' if worse else ''}")
+    return regressions
+
+
+BENCHMARKS = {
+    'chunked': bench_chunked,
+    'click': bench_click,
+    'env': bench_env,
+    'suite': bench_suite,
+    'layout': bench_layout,
+    'generate': bench_generate,
+    'reveal': bench_reveal,
+    'save': bench_save,
+    'stats': bench_stats,
+    'frame': bench_frame,
+    'loop': bench_loop,
+    'startup': bench_startup,
+}
+
+
+def options(args):
+    """returns the options that change what the results mean
+    """
+    return {'sizes': args.sizes, 'densities': args.densities, 'frames': args.frames, 'repeat': args.repeat}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--sizes', type=int, nargs='+', default=[16, 256, 2048],
+                        help='board sizes, every board is size x size')
+    parser.add_argument('--max-dict-cells', type=int, default=1 << 20,
+                        help='boards bigger than this have the dict layout cost estimated instead of measured')
+    parser.add_argument('--densities', type=float, nargs='+', default=[0.15, 0.5, 0.99],
+                        help='fraction of the tiles that are mines')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--frames', type=int, default=500)
+    parser.add_argument('--fps', type=int, default=60, help='frame rate cap for the loop benchmark')
+    parser.add_argument('--seconds', type=float, default=3, help='how long each loop benchmark runs')
+    parser.add_argument('--repeat', type=int, default=5, help='timings take the best of this many runs')
+    parser.add_argument('--output', default=None, help='write the results to this file as JSON')
+    parser.add_argument('--baseline', default=None, help='compare the results against an earlier --output')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='how much worse than the baseline a result can get before it is a regression')
+    parser.add_argument('--noise-floor', type=float, default=0.02,
+                        help='timings that changed by fewer milliseconds than this are never a regression')
+    args = parser.parse_args()
+    args.results = []
+    BENCHMARKS[args.benchmark](args)
+
+    if args.output is not None:
+        with open(args.output, 'w') as file:
+            json.dump({
+                'benchmark': args.benchmark,
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'system': platform.system(),
+                'options': options(args),
+                'results': args.results,
+            }, file, indent=1)
+            file.write('\n')
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline.get('options') != options(args):
+            print(f"the baseline was made with {baseline.get('options')}, not {options(args)}", file=sys.stderr)
+        regressions = compare(args.results, baseline, args.tolerance, args.noise_floor)
+        if regressions:
+            print(f"{len(regressions)} regressions: {', '.join(regressions)}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,350 @@
+""" headless minesweeper board engine, it does not import pygame so it can be used without a display
+
+the board is stored as one bytearray with one byte per tile, tile (row, column) is at
+index row * num_columns + column. each byte is split into bit fields:
+
+    bits 0-3  number of adjacent mines (0 to 8)
+    bit 4     COVERED
+    bit 5     MINE
+    bit 6     FLAGGED
+
+so a board costs 1 byte per tile plus the bytearray header (about 57 bytes). the old
+list of dicts layout cost about 192 bytes per tile on CPython 3.11 (a 184 byte dict with
+four keys plus an 8 byte pointer in the row list), so a 2048x2048 board went from
+roughly 800 MB to 4 MB. run `python benchmark.py layout` to measure it on your machine.
+"""
+import random
+from array import array
+from itertools import repeat
+from operator import add, and_, or_, sub
+
+ADJACENT = 0x0F
+COVERED = 0x10
+MINE = 0x20
+FLAGGED = 0x40
+
+# translation table that turns packed cells into 1 for a mine and 0 for anything else
+MINE_PLANE = bytes((cell & MINE) >> 5 for cell in range(256))
+
+# the same for flags, covered tiles without a mine and uncovered mines
+FLAGGED_PLANE = bytes((cell & FLAGGED) >> 6 for cell in range(256))
+COVERED_SAFE_PLANE = bytes(int(cell & (COVERED | MINE) == COVERED) for cell in range(256))
+UNCOVERED_MINE_PLANE = bytes(int(cell & (COVERED | MINE) == MINE) for cell in range(256))
+
+
+class Board(object):
+    """ stores the state of one minesweeper board and applies the game rules to it
+    """
+    def __init__(self, num_rows=16, num_columns=16, num_mines=40, seed=None, debug=False, safe=None, cells=None):
+        """ creates the board, places the mines and counts the adjacent mines for every tile,
+        the same seed always gives the same mines and a random one is picked when it is None.
+        with debug the counters are checked against a recount of the board after every move.
+        safe is a (row, column) that gets no mine and, when there is room, no mines around it,
+        so uncovering it first opens up the board. cells are the packed cells of a board in
+        progress, like a loaded game, to use instead of placing mines
+        """
+        if not 0 <= num_mines <= num_rows * num_columns:
+            raise ValueError(f"cannot place {num_mines} mines on a {num_rows}x{num_columns} board")
+        self.num_rows = num_rows
+        self.num_columns = num_columns
+        self.num_mines = num_mines
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        self.seed = seed
+        self.init_counters(debug)
+
+        self.safe = safe
+        if cells is None:
+            self.cells = self.create_initial_state()
+            self.place_mines(random.Random(seed), self.safe_tiles(safe))
+        else:
+            self.cells = bytearray(cells)
+            self.num_flags = self.cells.translate(FLAGGED_PLANE).count(1)
+            self.covered_safe = self.cells.translate(COVERED_SAFE_PLANE).count(1)
+            self.game_over = self.cells.translate(UNCOVERED_MINE_PLANE).count(1) > 0
+            self.game_won = self.covered_safe == 0 and not self.game_over
+        self.calculate_adjacent_mines()
+
+    def init_counters(self, debug=False):
+        """sets the counters and flags of a board with every tile covered, num_rows, num_columns
+        and num_mines have to be set first. boards that make their cells another way call it too
+        """
+        # number of flags currently placed on the board
+        self.num_flags = 0
+
+        # number of covered tiles without a mine, the game is won when it reaches 0
+        self.covered_safe = self.num_rows * self.num_columns - self.num_mines
+
+        self.debug = debug
+
+        # set when a mine is uncovered
+        self.game_over = False
+
+        # set when every tile without a mine is uncovered
+        self.game_won = False
+
+    @property
+    def mines_remaining(self):
+        """number of mines that have not been flagged yet, as shown by the flag counter
+        """
+        return self.num_mines - self.num_flags
+
+    def check_counters(self):
+        """recounts the whole board and raises AssertionError if a running counter is wrong,
+        this is slow and only meant for debugging
+        """
+        cells = self.cells
+        covered_safe = sum(1 for cell in cells if cell & (COVERED | MINE) == COVERED)
+        num_flags = sum(1 for cell in cells if cell & FLAGGED)
+        if covered_safe != self.covered_safe:
+            raise AssertionError(f"covered_safe is {self.covered_safe} but the board has {covered_safe}")
+        if num_flags != self.num_flags:
+            raise AssertionError(f"num_flags is {self.num_flags} but the board has {num_flags}")
+
+    def snapshot(self):
+        """returns a copy of everything a move can change, restore() puts the board back to it
+        """
+        return bytes(self.cells), self.num_flags, self.covered_safe, self.game_over, self.game_won
+
+    def restore(self, snapshot):
+        cells, self.num_flags, self.covered_safe, self.game_over, self.game_won = snapshot
+        self.cells[:] = cells
+
+    def create_initial_state(self):
+        """returns the packed cells with every tile covered
+        """
+        return bytearray([COVERED]) * (self.num_rows * self.num_columns)
+
+    def index(self, row, column):
+        """returns the index of a tile in self.cells
+        """
+        return row * self.num_columns + column
+
+    def in_bounds(self, row, column):
+        """returns True if the row and column are on the board
+        """
+        return 0 <= row < self.num_rows and 0 <= column < self.num_columns
+
+    def is_covered(self, row, column):
+        return bool(self.cells[row * self.num_columns + column] & COVERED)
+
+    def is_mine(self, row, column):
+        return bool(self.cells[row * self.num_columns + column] & MINE)
+
+    def is_flagged(self, row, column):
+        return bool(self.cells[row * self.num_columns + column] & FLAGGED)
+
+    def adjacent_mines(self, row, column):
+        return self.cells[row * self.num_columns + column] & ADJACENT
+
+    def calculate_adjacent_mines(self):
+        """counts the adjacent mines of every tile in one pass over the whole board. the mine
+        bits are padded with a border of empty tiles, summed with their left and right
+        neighbours and then with the rows above and below, so all the work happens in
+        map() over bytes instead of looking at the 8 neighbours of every tile in python
+        """
+        cells = self.cells
+        num_rows = self.num_rows
+        num_columns = self.num_columns
+        plane = bytes(cells).translate(MINE_PLANE)
+        edge = bytes(num_columns + 2)
+        padded = b''.join(
+            [edge]
+            + [b'\0' + plane[row * num_columns:(row + 1) * num_columns] + b'\0' for row in range(num_rows)]
+            + [edge]
+        )
+        around = count_around(padded, num_rows, num_columns)
+        cells[:] = bytes(map(or_, map(and_, cells, repeat(~ADJACENT & 0xFF)), map(sub, around, plane)))
+
+    def uncovered_tiles(self):
+        """returns the indexes of every uncovered tile
+        """
+        cells = self.cells
+        return [i for i in range(len(cells)) if not cells[i] & COVERED]
+
+    def safe_tiles(self, safe):
+        """returns the sorted indexes that must not get a mine for a safe (row, column)
+        """
+        if safe is None:
+            return []
+        row, column = safe
+        if not self.in_bounds(row, column):
+            raise ValueError(f"safe tile {safe} is not on the board")
+        tiles = [
+            self.index(r, c)
+            for r in range(max(row - 1, 0), min(row + 2, self.num_rows))
+            for c in range(max(column - 1, 0), min(column + 2, self.num_columns))
+        ]
+        if self.num_mines > len(self.cells) - len(tiles):
+            # too many mines to keep the whole opening clear, so only the tile itself is safe
+            tiles = [self.index(row, column)]
+            if self.num_mines > len(self.cells) - 1:
+                raise ValueError(f"no room for a safe tile with {self.num_mines} mines")
+        return tiles
+
+    def place_mines(self, rng, excluded=()):
+        """places num_mines mines by sampling tile indexes without replacement, so it takes
+        O(mines) time. when more than half of the board is mines the safe tiles are sampled
+        instead, so a nearly full board is as quick as a nearly empty one. excluded is a
+        sorted list of indexes that must not get a mine
+        """
+        cells = self.cells
+        num_cells = len(cells)
+        free = num_cells - len(excluded)
+
+        def skip_excluded(i):
+            # turns the i-th tile that isn't excluded into its index on the board
+            for tile in excluded:
+                if tile > i:
+                    break
+                i += 1
+            return i
+
+        if self.num_mines <= free // 2:
+            for i in rng.sample(range(free), self.num_mines):
+                cells[skip_excluded(i)] |= MINE
+        else:
+            cells[:] = bytes([COVERED | MINE]) * num_cells
+            for i in excluded:
+                cells[i] = COVERED
+            for i in rng.sample(range(free), free - self.num_mines):
+                cells[skip_excluded(i)] &= ~MINE
+
+    def uncover(self, row, column, unflagged=None):
+        """ uncovers a tile and checks for win or lose conditions when the tile is uncovered,
+        returns the indexes of every tile that was uncovered so only those need redrawing.
+        the indexes of the flags that were cleared by uncovering the tiles under them are
+        appended to unflagged when it is given
+        """
+        if self.game_over or not self.in_bounds(row, column):
+            return array('q')
+        cells = self.cells
+        i = self.index(row, column)
+        if cells[i] & FLAGGED or not cells[i] & COVERED:
+            return array('q')
+
+        cells[i] &= ~COVERED
+        revealed = array('q', [i])
+        if cells[i] & MINE:
+            self.game_over = True
+            revealed.extend(self.reveal_board())
+            if self.debug:
+                self.check_counters()
+            return revealed
+
+        if cells[i] & ADJACENT == 0:
+            revealed.extend(self.clear_adjacent_tiles(row, column, unflagged))
+
+        self.covered_safe -= len(revealed)
+        if self.covered_safe == 0:
+            self.game_won = True
+        if self.debug:
+            self.check_counters()
+        return revealed
+
+    def reveal_board(self):
+        """reveals the mines on the board, is called when a mine is uncovered and the game is over,
+        returns the indexes of the mines that were uncovered
+        """
+        cells = self.cells
+        revealed = array('q')
+        for i in range(len(cells)):
+            if cells[i] & (MINE | COVERED) == MINE | COVERED:
+                cells[i] &= ~COVERED
+                revealed.append(i)
+        return revealed
+
+    def cover_late_mines(self):
+        """covers the mines that were uncovered after the game was lost without a move, for
+        undoing the move that lost, and returns them. this board uncovers all of its mines as
+        it is lost so there are none, a chunked.ChunkedBoard has some
+        """
+        return array('q')
+
+    def uncover_late_mines(self):
+        """uncovers the mines that cover_late_mines covered again, for redoing the move that
+        lost, and returns them
+        """
+        return array('q')
+
+    def flag(self, row, column):
+        """places or removes a flag, a flag can only be placed on a covered tile while flags are left
+        """
+        if self.game_over or not self.in_bounds(row, column):
+            return
+        cells = self.cells
+        i = self.index(row, column)
+        if cells[i] & FLAGGED:
+            cells[i] &= ~FLAGGED
+            self.num_flags -= 1
+        elif cells[i] & COVERED:
+            if self.num_flags < self.num_mines:
+                cells[i] |= FLAGGED
+                self.num_flags += 1
+        if self.debug:
+            self.check_counters()
+
+    def clear_adjacent_tiles(self, row, column, unflagged=None):
+        """this clears tiles that are adjacent to tiles with 0 adjacent mines and keeps going
+        from every cleared tile that also has 0 adjacent mines. it uses a stack instead of
+        recursion so big open areas can't hit the recursion limit, and a tile is uncovered
+        as soon as it is found so it is only ever pushed once. returns the indexes of the
+        tiles that were uncovered, the ones that had a flag are also appended to unflagged
+        """
+        cells = self.cells
+        num_rows = self.num_rows
+        num_columns = self.num_columns
+        last_row = num_rows - 1
+        last = num_columns - 1
+        around = (-num_columns - 1, -num_columns, -num_columns + 1, -1, 1,
+                  num_columns - 1, num_columns, num_columns + 1)
+        # an array of machine integers is 8 bytes per tile where a list of ints is about 36
+        revealed = array('q')
+        stack = [self.index(row, column)]
+        while stack:
+            tile = stack.pop()
+            row, column = divmod(tile, num_columns)
+            if 0 < row < last_row and 0 < column < last:
+                # most tiles are away from the edges, so their neighbours need no bounds checks
+                for offset in around:
+                    i = tile + offset
+                    cell = cells[i]
+                    if cell & COVERED:
+                        if cell & FLAGGED:
+                            self.num_flags -= 1
+                            if unflagged is not None:
+                                unflagged.append(i)
+                        cells[i] = cell & ~(COVERED | FLAGGED)
+                        revealed.append(i)
+                        if cell & ADJACENT == 0:
+                            stack.append(i)
+                continue
+            first_column = max(column - 1, 0)
+            last_column = min(column + 2, num_columns)
+            for r in range(max(row - 1, 0), min(row + 2, num_rows)):
+                start = r * num_columns
+                for i in range(start + first_column, start + last_column):
+                    cell = cells[i]
+                    if cell & COVERED:
+                        if cell & FLAGGED:
+                            self.num_flags -= 1
+                            if unflagged is not None:
+                                unflagged.append(i)
+                        cells[i] = cell & ~(COVERED | FLAGGED)
+                        revealed.append(i)
+                        if cell & ADJACENT == 0:
+                            stack.append(i)
+        return revealed
+
+
+def count_around(padded, num_rows, num_columns):
+    """takes the mine bits of a num_rows x num_columns area with a border one tile wide all
+    around it, as bytes of 0 and 1, and returns the number of mines in the 3x3 block around
+    each tile of the area, the tile itself included
+    """
+    width = num_columns + 2
+    # horizontal[j] is the sum of the 3 padded tiles centered on j + 1
+    horizontal = bytes(map(add, map(add, padded, padded[1:]), padded[2:]))
+    # square[j] is the sum of the 3x3 block centered on j + 1 + width
+    square = bytes(map(add, map(add, horizontal, horizontal[width:]), horizontal[2 * width:]))
+    return b''.join([square[row * width:row * width + num_columns] for row in range(num_rows)])
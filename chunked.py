@@ -0,0 +1,382 @@
+""" boards too big to store, generated one chunk at a time the first time a chunk is looked at
+
+the board is split into chunk_size x chunk_size chunks. the mines of a chunk only depend on
+the seed and where the chunk is, and every chunk gets round(density * tiles in the chunk)
+mines, so the total number of mines is known without generating anything. the cells of a
+chunk (one byte per tile, packed like board.Board) are made when one of its tiles is first
+read, using the mines of the 8 chunks around it for the numbers along its edges. memory
+grows with the number of chunks that have been looked at, not with the size of the board.
+
+uncovering a tile with no mines around it only floods through the chunks that have been
+made, so an opening on a sparse board can't run over millions of tiles in one click. the
+flood is carried on into the other chunks by expand() as they come into view.
+"""
+import random
+from array import array
+from itertools import product
+from operator import or_, sub
+
+from board import Board, ADJACENT, COVERED, FLAGGED, MINE, MINE_PLANE, count_around
+
+
+# the lowest density a game is played in chunks with, the openings of emptier boards are so
+# big that most of the board would be one flood
+MIN_DENSITY = 0.01
+
+
+class ChunkedCells(object):
+    """ stands in for the bytearray of a board.Board, tile indexes are row * num_columns + column
+    just the same, but reading a tile makes its chunk if it doesn't exist yet
+    """
+    def __init__(self, board):
+        self.board = board
+
+    def __len__(self):
+        return self.board.num_rows * self.board.num_columns
+
+    def locate(self, index):
+        """returns (chunk cells, index in the chunk) for a tile index
+        """
+        board = self.board
+        size = board.chunk_size
+        row, column = divmod(index, board.num_columns)
+        chunk_row, row = divmod(row, size)
+        chunk_column, column = divmod(column, size)
+        width = min(size, board.num_columns - chunk_column * size)
+        return board.chunk(chunk_row, chunk_column), row * width + column
+
+    def __getitem__(self, index):
+        chunk, i = self.locate(index)
+        return chunk[i]
+
+    def __setitem__(self, index, value):
+        chunk, i = self.locate(index)
+        chunk[i] = value
+
+
+class ChunkedBoard(Board):
+    """ a board.Board whose tiles are generated lazily in chunks from the seed
+    """
+    def __init__(self, num_rows, num_columns, density=0.15625, seed=None, chunk_size=64, debug=False):
+        """ density is the fraction of each chunk that is mines, the default matches 40 mines
+        on the 16x16 board
+        """
+        if not 0 <= density < 1:
+            raise ValueError(f"density must be at least 0 and below 1, not {density}")
+        self.num_rows = num_rows
+        self.num_columns = num_columns
+        self.density = density
+        self.chunk_size = chunk_size
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        self.seed = seed
+        self.safe = None
+        self.num_mines = self.count_mines()
+        self.init_counters(debug)
+
+        # (chunk row, chunk column) -> cells of the chunks made so far
+        self.chunks = {}
+
+        # (chunk row, chunk column) -> mine positions, kept for the edges of the next chunks
+        self.mine_cache = {}
+
+        # board indexes of the mines uncovered in chunks made after the game was lost, no move
+        # uncovered them so undoing the move that lost covers them with cover_late_mines
+        self.late_mines = array('q')
+
+        # chunks expand() has carried the floods next to them on into
+        self.expanded = set()
+
+        # board index of an uncovered tile whose flood stopped at a chunk that wasn't made ->
+        # the tiles revealed by the uncover that made it, carrying the flood on from it adds
+        # to them so undoing the move takes the rest of its flood back too
+        self.owners = {}
+
+        # tiles the last flood stopped at, uncover() gives them their owner
+        self.stopped = []
+
+        self.cells = ChunkedCells(self)
+
+    def chunk_shape(self, chunk_row, chunk_column):
+        """returns the (rows, columns) of a chunk, chunks on the bottom and right edges can be smaller
+        """
+        size = self.chunk_size
+        return (min(size, self.num_rows - chunk_row * size),
+                min(size, self.num_columns - chunk_column * size))
+
+    def mines_in_chunk(self, rows, columns):
+        return round(self.density * rows * columns)
+
+    def count_mines(self):
+        """works out the total number of mines from the chunk sizes without generating anything
+        """
+        size = self.chunk_size
+        full_rows, last_rows = divmod(self.num_rows, size)
+        full_columns, last_columns = divmod(self.num_columns, size)
+        return (
+            full_rows * full_columns * self.mines_in_chunk(size, size)
+            + full_rows * self.mines_in_chunk(size, last_columns)
+            + full_columns * self.mines_in_chunk(last_rows, size)
+            + self.mines_in_chunk(last_rows, last_columns)
+        )
+
+    def chunk_mines(self, chunk_row, chunk_column):
+        """returns the positions in the chunk (row * chunk columns + column) that are mines
+        """
+        key = (chunk_row, chunk_column)
+        mines = self.mine_cache.get(key)
+        if mines is None:
+            rows, columns = self.chunk_shape(chunk_row, chunk_column)
+            rng = random.Random(f"{self.seed} {chunk_row} {chunk_column}")
+            mines = array('I', rng.sample(range(rows * columns), self.mines_in_chunk(rows, columns)))
+            if len(self.mine_cache) >= 4096:
+                self.mine_cache.clear()
+            self.mine_cache[key] = mines
+        return mines
+
+    def chunk(self, chunk_row, chunk_column):
+        """returns the cells of a chunk, making them the first time
+        """
+        key = (chunk_row, chunk_column)
+        cells = self.chunks.get(key)
+        if cells is not None:
+            return cells
+        cells = self.make_chunk(chunk_row, chunk_column)
+        if self.game_over:
+            self.reveal_chunk(chunk_row, chunk_column, cells)
+        self.chunks[key] = cells
+        return cells
+
+    def make_chunk(self, chunk_row, chunk_column):
+        """returns new cells for a chunk with every tile covered
+        """
+        size = self.chunk_size
+        rows, columns = self.chunk_shape(chunk_row, chunk_column)
+        cells = bytearray([COVERED]) * (rows * columns)
+        for i in self.chunk_mines(chunk_row, chunk_column):
+            cells[i] |= MINE
+
+        # mine bits of the chunk with a one tile border, taken from the chunks around it
+        width = columns + 2
+        padded = bytearray((rows + 2) * width)
+        for r in range(max(chunk_row - 1, 0), chunk_row + 2):
+            for c in range(max(chunk_column - 1, 0), chunk_column + 2):
+                if r * size >= self.num_rows or c * size >= self.num_columns:
+                    continue
+                other_columns = self.chunk_shape(r, c)[1]
+                row_offset = (r - chunk_row) * size + 1
+                column_offset = (c - chunk_column) * size + 1
+                for i in self.chunk_mines(r, c):
+                    row, column = divmod(i, other_columns)
+                    row += row_offset
+                    column += column_offset
+                    if 0 <= row < rows + 2 and 0 <= column < width:
+                        padded[row * width + column] = 1
+
+        plane = bytes(cells).translate(MINE_PLANE)
+        around = count_around(bytes(padded), rows, columns)
+        cells[:] = bytes(map(or_, cells, map(sub, around, plane)))
+        return cells
+
+    def reveal_chunk(self, chunk_row, chunk_column, cells):
+        """uncovers the mines of a chunk made after the game was lost, so it looks like it would
+        have if it had been made before, and adds them to late_mines
+        """
+        size = self.chunk_size
+        columns = self.chunk_shape(chunk_row, chunk_column)[1]
+        for i in range(len(cells)):
+            if cells[i] & (MINE | COVERED) == MINE | COVERED:
+                cells[i] &= ~COVERED
+                row, column = divmod(i, columns)
+                self.late_mines.append((chunk_row * size + row) * self.num_columns + chunk_column * size + column)
+
+    def cover_late_mines(self):
+        """covers the late_mines again for undoing the move that lost and returns them
+        """
+        late_mines = self.late_mines
+        self.late_mines = array('q')
+        cells = self.cells
+        for i in late_mines:
+            cells[i] |= COVERED
+        return late_mines
+
+    def uncover_late_mines(self):
+        """uncovers the mines of the chunks made since the move that lost was undone, for
+        redoing it, and returns them
+        """
+        self.late_mines = array('q', self.reveal_board())
+        return self.late_mines
+
+    def uncover(self, row, column, unflagged=None):
+        """uncovers a tile like Board.uncover, the flood stops at the chunks that haven't been
+        made. the tiles that expand() uncovers when it carries the flood on later are added to
+        the array this returns
+        """
+        self.stopped = []
+        revealed = Board.uncover(self, row, column, unflagged)
+        for tile in self.stopped:
+            self.owners[tile] = revealed
+        self.stopped = []
+        return revealed
+
+    def clear_adjacent_tiles(self, row, column, unflagged=None, flags=True):
+        """the flood of Board.clear_adjacent_tiles kept to the chunks that have been made, the
+        tiles it stopped at because a tile next to them is in another chunk are put in stopped.
+        without flags it leaves flagged tiles covered instead of clearing the flags
+        """
+        size = self.chunk_size
+        num_rows = self.num_rows
+        num_columns = self.num_columns
+        chunks = self.chunks
+        revealed = array('q')
+        stack = [row * num_columns + column]
+        while stack:
+            tile = stack.pop()
+            row, column = divmod(tile, num_columns)
+            stopped = False
+            for r in range(max(row - 1, 0), min(row + 2, num_rows)):
+                chunk_row, chunk_r = divmod(r, size)
+                for c in range(max(column - 1, 0), min(column + 2, num_columns)):
+                    chunk_column, chunk_c = divmod(c, size)
+                    cells = chunks.get((chunk_row, chunk_column))
+                    if cells is None:
+                        stopped = True
+                        continue
+                    j = chunk_r * min(size, num_columns - chunk_column * size) + chunk_c
+                    cell = cells[j]
+                    if cell & COVERED and (flags or not cell & FLAGGED):
+                        i = r * num_columns + c
+                        if cell & FLAGGED:
+                            self.num_flags -= 1
+                            if unflagged is not None:
+                                unflagged.append(i)
+                        cells[j] = cell & ~(COVERED | FLAGGED)
+                        revealed.append(i)
+                        if cell & ADJACENT == 0:
+                            stack.append(i)
+            if stopped:
+                self.stopped.append(tile)
+        return revealed
+
+    def expand(self, rows, columns):
+        """makes the chunks holding the tiles in rows and columns, two ranges like the view of
+        the board, and carries on the floods of the uncovered tiles next to them that stopped
+        there. returns the indexes of the tiles that were uncovered. the flags that were placed
+        in the way are left alone, taking them off here would be out of order with the moves
+        that placed them when they are undone
+        """
+        revealed = array('q')
+        if not rows or not columns:
+            return revealed
+        size = self.chunk_size
+        new = [key for key in product(range(rows[0] // size, rows[-1] // size + 1),
+                                      range(columns[0] // size, columns[-1] // size + 1))
+               if key not in self.expanded]
+        for key in new:
+            self.chunk(*key)
+            self.expanded.add(key)
+        num_rows = self.num_rows
+        num_columns = self.num_columns
+        for chunk_row, chunk_column in new:
+            rows, columns = self.chunk_shape(chunk_row, chunk_column)
+            top = chunk_row * size
+            left = chunk_column * size
+            # the tiles around the chunk, a flood that stopped at it stopped on one of them
+            ring = [(r, c) for r in range(top - 1, top + rows + 1) for c in (left - 1, left + columns)]
+            ring += [(r, c) for r in (top - 1, top + rows) for c in range(left, left + columns)]
+            for row, column in ring:
+                if not 0 <= row < num_rows or not 0 <= column < num_columns:
+                    continue
+                cells = self.chunks.get((row // size, column // size))
+                if cells is None:
+                    continue
+                cell = cells[(row % size) * self.chunk_shape(row // size, column // size)[1] + column % size]
+                if cell & (COVERED | MINE | ADJACENT):
+                    continue
+                tile = row * num_columns + column
+                owner = self.owners.pop(tile, None)
+                self.stopped = []
+                flood = self.clear_adjacent_tiles(row, column, flags=False)
+                for stopped in self.stopped:
+                    if owner is not None:
+                        self.owners[stopped] = owner
+                self.stopped = []
+                if owner is not None:
+                    owner.extend(flood)
+                revealed.extend(flood)
+        self.covered_safe -= len(revealed)
+        if revealed and self.covered_safe == 0:
+            self.game_won = True
+        if self.debug:
+            self.check_counters()
+        return revealed
+
+    def find_opening(self, row, column):
+        """returns a tile in the chunk holding (row, column) that has no mines around it, or
+        one that isn't a mine when the chunk has no such tile, to start a game from
+        """
+        size = self.chunk_size
+        chunk_row = row // size
+        chunk_column = column // size
+        cells = self.chunk(chunk_row, chunk_column)
+        columns = self.chunk_shape(chunk_row, chunk_column)[1]
+        safe = [i for i in range(len(cells)) if not cells[i] & MINE]
+        if not safe:
+            return row, column
+        openings = [i for i in safe if cells[i] & ADJACENT == 0]
+        r, c = divmod((openings or safe)[0], columns)
+        return chunk_row * size + r, chunk_column * size + c
+
+    def chunk_tiles(self):
+        """yields (board index, chunk cells, index in chunk) for every tile of the chunks made so far
+        """
+        size = self.chunk_size
+        num_columns = self.num_columns
+        for (chunk_row, chunk_column), cells in self.chunks.items():
+            columns = self.chunk_shape(chunk_row, chunk_column)[1]
+            for i in range(len(cells)):
+                row, column = divmod(i, columns)
+                yield (chunk_row * size + row) * num_columns + chunk_column * size + column, cells, i
+
+    def snapshot(self):
+        """copies the chunks made so far, the others will be made the same way again when needed
+        """
+        chunks = {key: bytes(cells) for key, cells in self.chunks.items()}
+        return chunks, frozenset(self.expanded), self.num_flags, self.covered_safe, self.game_over, self.game_won
+
+    def restore(self, snapshot):
+        chunks, expanded, self.num_flags, self.covered_safe, self.game_over, self.game_won = snapshot
+        self.chunks = {key: bytearray(cells) for key, cells in chunks.items()}
+        self.expanded = set(expanded)
+        self.late_mines = array('q')
+        self.owners = {}
+
+    def reveal_board(self):
+        """reveals the mines in the chunks that have been made, the others reveal theirs when
+        they are made
+        """
+        revealed = []
+        for index, cells, i in self.chunk_tiles():
+            if cells[i] & (MINE | COVERED) == MINE | COVERED:
+                cells[i] &= ~COVERED
+                revealed.append(index)
+        return revealed
+
+    def uncovered_tiles(self):
+        return [index for index, cells, i in self.chunk_tiles() if not cells[i] & COVERED]
+
+    def check_counters(self):
+        """recounts the chunks that have been made, every other tile is still covered
+        """
+        uncovered_safe = 0
+        num_flags = 0
+        for index, cells, i in self.chunk_tiles():
+            if cells[i] & (COVERED | MINE) == 0:
+                uncovered_safe += 1
+            if cells[i] & FLAGGED:
+                num_flags += 1
+        covered_safe = self.num_rows * self.num_columns - self.num_mines - uncovered_safe
+        if covered_safe != self.covered_safe:
+            raise AssertionError(f"covered_safe is {self.covered_safe} but the board has {covered_safe}")
+        if num_flags != self.num_flags:
+            raise AssertionError(f"num_flags is {self.num_flags} but the board has {num_flags}")
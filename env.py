@@ -0,0 +1,156 @@
+""" steps a batch of independent boards at once for training automatic players, without pygame
+
+the cells of every board live in one bytearray, board b is cells[b * tiles:(b + 1) * tiles]
+with the same packed layout as board.py, and each Board in the batch works on its own
+slice of it through a memoryview, so the moves follow exactly the same rules as the game.
+the observation of the whole batch is one translate() of that bytearray into
+
+    0-8         an uncovered tile with that many mines next to it
+    COVERED_OBS     a covered tile
+    FLAGGED_OBS     a flagged tile
+    MINE_OBS        an uncovered mine
+
+as bytes of num_boards * num_rows * num_columns, row by row like the cells. with numpy,
+numpy.frombuffer(observation, numpy.uint8).reshape(num_boards, num_rows, num_columns)
+gives it a shape without copying.
+
+    env = BatchEnv(num_boards=256, seed=1)
+    observation = env.reset()
+    observation, rewards, dones = env.step([(0, 8, 8, UNCOVER), (1, 3, 4, FLAG)])
+
+a board that is won or lost in a step is reset with a new board straight away, so the
+observation returned for it is already the new game's. run `python benchmark.py env` for
+the board-steps per second.
+"""
+import random
+from array import array
+
+from board import Board, ADJACENT, COVERED, FLAGGED, MINE
+
+# actions of a move
+UNCOVER = 0
+FLAG = 1
+
+COVERED_OBS = 9
+FLAGGED_OBS = 10
+MINE_OBS = 11
+
+# translation table from packed cells to observations
+OBSERVATION = bytes(
+    (FLAGGED_OBS if cell & FLAGGED else COVERED_OBS) if cell & COVERED else MINE_OBS if cell & MINE else cell & ADJACENT
+    for cell in range(256)
+)
+
+
+class BatchBoard(Board):
+    """ a board that doesn't show the mines when it is lost, a lost board in the batch is
+    replaced before anyone sees it so it would only cost time
+    """
+    def reveal_board(self):
+        return array('q')
+
+
+class BatchEnv(object):
+    """ num_boards boards of the same size played side by side, every move is
+    (board, row, column, action) with action UNCOVER or FLAG
+    """
+    # reward for uncovering a mine
+    LOSE_REWARD = -1.0
+
+    # reward for uncovering the last safe tile, on top of the reward for the tiles it uncovered
+    WIN_REWARD = 1.0
+
+    # reward for a move that changes nothing, like uncovering a tile that is already uncovered
+    NOOP_REWARD = -0.01
+
+    def __init__(self, num_boards=64, num_rows=16, num_columns=16, num_mines=40, seed=None):
+        """ the layouts of all the boards come from seed, so the same seed and moves always
+        give the same games. uncovering safe tiles is rewarded with the fraction of the safe
+        tiles they were, so winning a board adds up to 1 + WIN_REWARD
+        """
+        self.num_boards = num_boards
+        self.num_rows = num_rows
+        self.num_columns = num_columns
+        self.num_mines = num_mines
+        self.num_tiles = num_rows * num_columns
+        self.rng = random.Random(seed)
+
+        self.cells = bytearray(num_boards * self.num_tiles)
+        view = memoryview(self.cells)
+        self.views = [view[b * self.num_tiles:(b + 1) * self.num_tiles] for b in range(num_boards)]
+        self.boards = [None] * num_boards
+
+        # the seed of the board being played in each slot, Board(seed=...) makes it again
+        self.seeds = array('Q', bytes(8 * num_boards))
+
+        # boards finished since the start, and how many of them were won
+        self.games = 0
+        self.wins = 0
+
+        self.reset()
+
+    def reset_board(self, b):
+        """puts a new board in slot b
+        """
+        seed = self.rng.randrange(2 ** 32)
+        board = BatchBoard(self.num_rows, self.num_columns, self.num_mines, seed=seed)
+        self.views[b][:] = board.cells
+        board.cells = self.views[b]
+        self.boards[b] = board
+        self.seeds[b] = seed
+
+    def reset(self):
+        """starts a new game on every board and returns the observation
+        """
+        for b in range(self.num_boards):
+            self.reset_board(b)
+        return self.observation()
+
+    def observation(self):
+        return self.cells.translate(OBSERVATION)
+
+    def step(self, moves):
+        """plays moves, an iterable of (board, row, column, action), in order and returns the
+        observation, an array of the reward of every board and a bytearray with 1 for every
+        board that was finished. boards without a move get no reward, and moves after the one
+        that finished a board are ignored until it is reset at the end of the step
+        """
+        rewards = array('d', bytes(8 * self.num_boards))
+        dones = bytearray(self.num_boards)
+        boards = self.boards
+        num_columns = self.num_columns
+        safe_tiles = self.num_tiles - self.num_mines
+        for b, row, column, action in moves:
+            board = boards[b]
+            if dones[b]:
+                continue
+            if action == UNCOVER:
+                revealed = board.uncover(row, column)
+                if board.game_over:
+                    rewards[b] += self.LOSE_REWARD
+                    dones[b] = 1
+                elif revealed:
+                    rewards[b] += len(revealed) / safe_tiles
+                    if board.game_won:
+                        rewards[b] += self.WIN_REWARD
+                        dones[b] = 1
+                else:
+                    rewards[b] += self.NOOP_REWARD
+            elif action == FLAG:
+                if not board.in_bounds(row, column):
+                    rewards[b] += self.NOOP_REWARD
+                    continue
+                i = row * num_columns + column
+                cell = board.cells[i]
+                board.flag(row, column)
+                if board.cells[i] == cell:
+                    rewards[b] += self.NOOP_REWARD
+            else:
+                raise ValueError(f"unknown action {action!r}, use UNCOVER or FLAG")
+
+        for b in range(self.num_boards):
+            if dones[b]:
+                self.games += 1
+                self.wins += boards[b].game_won
+                self.reset_board(b)
+        return self.observation(), rewards, dones
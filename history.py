@@ -0,0 +1,150 @@
+""" undo and redo for the moves played on a board.Board
+
+every move keeps only what it changed: the indexes of the tiles it uncovered, the flags the
+flood cleared on the way and whether it lost the game, the counters of the board are moved
+by what the move changed. so memory grows
+with the tiles the moves changed and not with the size of the board, and undoing or redoing
+a move takes time in the number of tiles it changed, a click that cleared a whole empty board
+is undone in one pass over its own indexes without looking at the rest of the board. the
+flood of a chunked.ChunkedBoard goes on growing as chunks come into view, after other moves,
+which is why the counters can't just be put back to what they were.
+"""
+from array import array
+
+from board import COVERED, FLAGGED, MINE
+
+# kinds of move
+UNCOVER = 0
+FLAG = 1
+
+
+class Move(object):
+    """ what one move changed, tiles are the uncovered tiles or the one flag that was placed
+    or removed, and lost is set when it uncovered a mine
+    """
+    __slots__ = ('kind', 'tiles', 'unflagged', 'lost')
+
+    def __init__(self, kind, tiles, unflagged, lost=False):
+        self.kind = kind
+        self.tiles = tiles
+        self.unflagged = unflagged
+        self.lost = lost
+
+
+class History(object):
+    """ plays moves on a board and remembers them so they can be undone and redone, playing
+    a new move after undoing forgets the moves that could have been redone
+    """
+    def __init__(self, board):
+        self.board = board
+        self.done = []
+        self.undone = []
+
+    def clear(self):
+        """forgets every move, the board stays as it is
+        """
+        self.done = []
+        self.undone = []
+
+    def can_undo(self):
+        return bool(self.done)
+
+    def can_redo(self):
+        return bool(self.undone)
+
+    def uncover(self, row, column):
+        """uncovers a tile like Board.uncover and returns the indexes of the tiles it uncovered
+        """
+        board = self.board
+        game_over = board.game_over
+        unflagged = array('q')
+        revealed = board.uncover(row, column, unflagged)
+        if revealed:
+            self.done.append(Move(UNCOVER, revealed, unflagged, board.game_over and not game_over))
+            self.undone = []
+        return revealed
+
+    def flag(self, row, column):
+        """places or removes a flag like Board.flag and returns the indexes of the tiles that
+        changed, none when it couldn't be placed
+        """
+        board = self.board
+        if not board.in_bounds(row, column):
+            return []
+        i = board.index(row, column)
+        cell = board.cells[i]
+        board.flag(row, column)
+        if board.cells[i] == cell:
+            return []
+        self.done.append(Move(FLAG, array('q', [i]), None))
+        self.undone = []
+        return [i]
+
+    def undo(self):
+        """takes back the last move and returns the indexes of the tiles that changed
+        """
+        if not self.done:
+            return []
+        move = self.done.pop()
+        board = self.board
+        cells = board.cells
+        changed = move.tiles
+        if move.kind == FLAG:
+            cells[move.tiles[0]] ^= FLAGGED
+            board.num_flags += 1 if cells[move.tiles[0]] & FLAGGED else -1
+        else:
+            safe = 0
+            for i in move.tiles:
+                cell = cells[i]
+                cells[i] = cell | COVERED
+                if not cell & MINE:
+                    safe += 1
+            for i in move.unflagged:
+                cells[i] |= FLAGGED
+            board.covered_safe += safe
+            board.num_flags += len(move.unflagged)
+            if move.lost:
+                board.game_over = False
+                changed = changed + board.cover_late_mines()
+        self.counted()
+        self.undone.append(move)
+        return changed
+
+    def redo(self):
+        """plays the last move that was undone again and returns the indexes of the tiles that
+        changed
+        """
+        if not self.undone:
+            return []
+        move = self.undone.pop()
+        board = self.board
+        cells = board.cells
+        changed = move.tiles
+        if move.kind == FLAG:
+            cells[move.tiles[0]] ^= FLAGGED
+            board.num_flags += 1 if cells[move.tiles[0]] & FLAGGED else -1
+        else:
+            safe = 0
+            for i in move.tiles:
+                cell = cells[i]
+                cells[i] = cell & ~COVERED
+                if not cell & MINE:
+                    safe += 1
+            for i in move.unflagged:
+                cells[i] &= ~FLAGGED
+            board.covered_safe -= safe
+            board.num_flags -= len(move.unflagged)
+            if move.lost:
+                board.game_over = True
+                changed = changed + board.uncover_late_mines()
+        self.counted()
+        self.done.append(move)
+        return changed
+
+    def counted(self):
+        """works out whether the game is won once the counters were moved by a move
+        """
+        board = self.board
+        board.game_won = board.covered_safe == 0 and not board.game_over
+        if board.debug:
+            board.check_counters()
@@ -0,0 +1,107 @@
+""" maps between pixel positions and board tiles, it does not import pygame so click replay
+tools can use it without a display
+"""
+
+
+class BoardLayout(object):
+    """ works out where tiles are on screen with plain arithmetic, so finding the tile under
+    the mouse takes the same time on any size of board
+    """
+    def __init__(self, num_rows, num_columns, tile_size, gap, buffer, view_width=None, view_height=None):
+        """ tiles are tile_size pixels wide with gap pixels between them, the first column
+        starts buffer pixels from the left edge and the first row at the top edge. only the
+        view_width x view_height pixels in the top left corner of the window show the board,
+        they default to the whole board and can be scrolled around a bigger one
+        """
+        self.num_rows = num_rows
+        self.num_columns = num_columns
+        self.buffer = buffer
+        self.set_tile_size(tile_size, gap)
+        if view_width is None:
+            view_width = num_columns * self.pitch + buffer
+        if view_height is None:
+            view_height = num_rows * self.pitch
+        self.view_width = view_width
+        self.view_height = view_height
+
+        # how many pixels of the board are scrolled out of the view on the left and at the top
+        self.offset_x = 0
+        self.offset_y = 0
+
+    def set_tile_size(self, tile_size, gap):
+        self.tile_size = tile_size
+        self.gap = gap
+
+        # distance from the start of one tile to the start of the next one
+        self.pitch = tile_size + gap
+
+    def scroll(self, dx, dy):
+        """moves the view by (dx, dy) pixels without going past the edges of the board, returns
+        True if it moved
+        """
+        max_x = max(self.num_columns * self.pitch + self.buffer - self.view_width, 0)
+        max_y = max(self.num_rows * self.pitch - self.view_height, 0)
+        offset_x = min(max(self.offset_x + dx, 0), max_x)
+        offset_y = min(max(self.offset_y + dy, 0), max_y)
+        moved = (offset_x, offset_y) != (self.offset_x, self.offset_y)
+        self.offset_x = offset_x
+        self.offset_y = offset_y
+        return moved
+
+    def center_on(self, row, column):
+        """scrolls so the tile is in the middle of the view, or as near as the edges allow
+        """
+        x, y = self.tile_position(row, column)
+        half = self.tile_size // 2
+        self.scroll(x + half - self.view_width // 2, y + half - self.view_height // 2)
+
+    def zoom(self, tile_size, gap, anchor):
+        """changes the tile size keeping the point of the board under anchor, an (x, y) in
+        the view, where it is
+        """
+        x = anchor[0] + self.offset_x - self.buffer
+        y = anchor[1] + self.offset_y
+        scale = (tile_size + gap) / self.pitch
+        self.set_tile_size(tile_size, gap)
+        self.offset_x = 0
+        self.offset_y = 0
+        self.scroll(round(x * scale) + self.buffer - anchor[0], round(y * scale) - anchor[1])
+
+    def visible_range(self):
+        """returns (rows, columns), the ranges of the tiles at least partly in the view
+        """
+        pitch = self.pitch
+        first_column = max((self.offset_x - self.buffer) // pitch, 0)
+        last_column = min((self.offset_x - self.buffer + self.view_width) // pitch + 1, self.num_columns)
+        first_row = self.offset_y // pitch
+        last_row = min((self.offset_y + self.view_height) // pitch + 1, self.num_rows)
+        return range(first_row, last_row), range(first_column, last_column)
+
+    def tile_position(self, row, column):
+        """returns the (x, y) of the top left corner of a tile
+        """
+        return column * self.pitch + self.buffer - self.offset_x, row * self.pitch - self.offset_y
+
+    def tile_rect(self, row, column):
+        """returns the (x, y, width, height) of a tile
+        """
+        x, y = self.tile_position(row, column)
+        return x, y, self.tile_size, self.tile_size
+
+    def cell_at(self, pos):
+        """returns the (row, column) of the tile under pos, or None when pos is in a gap
+        between tiles or outside the board or the view
+        """
+        if not (0 <= pos[0] < self.view_width and 0 <= pos[1] < self.view_height):
+            return None
+        x = pos[0] - self.buffer + self.offset_x
+        y = pos[1] + self.offset_y
+        if x < 0:
+            return None
+        column, x_in_tile = divmod(x, self.pitch)
+        row, y_in_tile = divmod(y, self.pitch)
+        if x_in_tile >= self.tile_size or y_in_tile >= self.tile_size:
+            return None
+        if row >= self.num_rows or column >= self.num_columns:
+            return None
+        return int(row), int(column)
@@ -0,0 +1,181 @@
+""" makes boards that can be finished by logic alone, starting from a given first click
+
+a board is tried by uncovering its start tile and then only ever uncovering tiles the
+solver proves safe. if the solver gets stuck before the board is won the board would need
+a guess, so another one is tried. a generated board is fully described by
+(rows, columns, mines, seed, start): Board(rows, columns, mines, seed=seed, safe=start)
+makes it again, which is what BoardPool hands out.
+"""
+import concurrent.futures
+import functools
+import json
+import multiprocessing
+import os
+import random
+import threading
+from collections import deque
+
+from board import Board
+from solver import Solver
+
+
+def is_no_guess(board, start):
+    """returns True if uncovering start and then only tiles the solver proves safe wins the
+    board, the board is played on so pass a fresh one
+    """
+    solver = Solver(board)
+    solver.update(board.uncover(*start))
+    while not board.game_won:
+        if board.game_over:
+            return False
+        if not solver.known_safe:
+            safe = solver.solve().safe
+            if not safe:
+                return False
+            solver.known_safe |= safe
+        tile = solver.known_safe.pop()
+        solver.update(board.uncover(*divmod(tile, board.num_columns)))
+    return True
+
+
+def generate_no_guess(num_rows, num_columns, num_mines, seed=None, start=None, max_attempts=10000):
+    """tries boards until one needs no guessing and returns (board seed, start, attempts). the
+    start defaults to the middle of the board and the board seeds tried come from seed, so
+    the same arguments always give the same board. raises RuntimeError after max_attempts
+    """
+    if start is None:
+        start = (num_rows // 2, num_columns // 2)
+    rng = random.Random(seed)
+    for attempt in range(1, max_attempts + 1):
+        board_seed = rng.randrange(2 ** 32)
+        board = Board(num_rows, num_columns, num_mines, seed=board_seed, safe=start)
+        if is_no_guess(board, start):
+            return board_seed, start, attempt
+    raise RuntimeError(f"no board without guessing found in {max_attempts} attempts for "
+                       f"{num_rows}x{num_columns} with {num_mines} mines")
+
+
+def generate_job(key):
+    """runs in a worker process and returns (key, seed, start) for a new no-guess board
+    """
+    num_rows, num_columns, num_mines = key
+    seed, start, attempts = generate_no_guess(num_rows, num_columns, num_mines)
+    return key, seed, start
+
+
+class BoardPool(object):
+    """ keeps up to size ready no-guess boards for each (rows, columns, mines), generated in
+    the background by worker processes so taking one doesn't have to wait for the search
+    """
+    # boards tried on the spot when the pool is empty, the search holds up the caller
+    QUICK_ATTEMPTS = 5
+
+    def __init__(self, size=4, processes=1, path=None):
+        """ processes is the number of worker processes. when path is given the boards left in
+        the pool are saved there by close() and loaded again the next time
+        """
+        self.size = size
+        self.processes = processes
+        self.path = path
+        self.lock = threading.Lock()
+
+        # notified with the lock held whenever a worker finished a job
+        self.ready = threading.Condition(self.lock)
+
+        # (rows, columns, mines) -> deque of (seed, start) ready to be played
+        self.boards = {}
+
+        # (rows, columns, mines) -> number of boards being generated
+        self.pending = {}
+
+        # sizes no no-guess board could be found for, they aren't tried again
+        self.failed = set()
+
+        # made the first time a board is needed, spawn keeps the workers away from pygame
+        self.executor = None
+
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def fill(self, num_rows, num_columns, num_mines):
+        """starts generating boards in the background until the pool for this size will be full
+        """
+        key = (num_rows, num_columns, num_mines)
+        with self.lock:
+            ready = len(self.boards.get(key, ()))
+            missing = self.size - ready - self.pending.get(key, 0)
+            if missing <= 0 or key in self.failed:
+                return
+            if self.executor is None:
+                self.executor = concurrent.futures.ProcessPoolExecutor(
+                    self.processes, mp_context=multiprocessing.get_context('spawn'))
+            self.pending[key] = self.pending.get(key, 0) + missing
+        for job in range(missing):
+            self.executor.submit(generate_job, key).add_done_callback(functools.partial(self.finished, key))
+
+    def finished(self, key, future):
+        """adds a board from a worker to the pool, a job that failed marks its size as failed
+        """
+        with self.lock:
+            self.pending[key] -= 1
+            self.ready.notify_all()
+            if future.cancelled():
+                return
+            if future.exception() is not None:
+                # a worker that died isn't the fault of the size
+                error = future.exception()
+                if isinstance(error, RuntimeError) and not isinstance(error, concurrent.futures.BrokenExecutor):
+                    self.failed.add(key)
+                return
+            key, seed, start = future.result()
+            self.boards.setdefault(key, deque()).append((seed, tuple(start)))
+
+    def take(self, num_rows, num_columns, num_mines, timeout=0.25):
+        """returns (seed, start) for a no-guess board and starts making a replacement. when the
+        pool is empty it waits up to timeout seconds for a worker and then tries QUICK_ATTEMPTS
+        boards itself. returns None when that found nothing or no no-guess board can be found
+        for this size, the caller plays a board that may need guessing instead
+        """
+        key = (num_rows, num_columns, num_mines)
+        self.fill(num_rows, num_columns, num_mines)
+        with self.ready:
+            self.ready.wait_for(lambda: self.boards.get(key) or not self.pending.get(key), timeout)
+            boards = self.boards.get(key)
+            board = boards.popleft() if boards else None
+            failed = key in self.failed
+        if board is None and not failed:
+            try:
+                seed, start, attempts = generate_no_guess(num_rows, num_columns, num_mines,
+                                                          max_attempts=self.QUICK_ATTEMPTS)
+                board = (seed, start)
+            except RuntimeError:
+                pass
+        self.fill(num_rows, num_columns, num_mines)
+        return board
+
+    def load(self, path):
+        """adds the boards saved in path to the pool
+        """
+        with open(path) as file:
+            saved = json.load(file)
+        with self.lock:
+            for entry in saved:
+                key = (entry['rows'], entry['columns'], entry['mines'])
+                boards = self.boards.setdefault(key, deque())
+                for seed, start in entry['boards'][:self.size]:
+                    boards.append((seed, tuple(start)))
+
+    def close(self):
+        """stops the workers and saves the boards that are left when the pool has a path
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+        if self.path is not None:
+            with self.lock:
+                saved = [
+                    {'rows': key[0], 'columns': key[1], 'mines': key[2], 'boards': [list(board) for board in boards]}
+                    for key, boards in self.boards.items() if boards
+                ]
+            with open(self.path, 'w') as file:
+                json.dump(saved, file)
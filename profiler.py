@@ -0,0 +1,145 @@
+""" collects frame timings for the profiler overlay and writes them to a JSON lines file
+
+Game only makes a Profiler while the overlay is shown or metrics are being written, every
+hook in the game checks `game.profiler is not None` first so it costs next to nothing when
+it is off. a frame is one pass of Game.loop from the moment its events were fetched until
+the window was updated, sleeping until the next frame is not counted. click latency is the
+time from fetching a mouse click to the end of the frame that showed it.
+
+every interval seconds a line like this is appended to the metrics file:
+
+    {"time": 1700000000.0, "frames": 60, "frame_ms": {"p50": 0.1, "p95": 2.1, "p99": 2.3, "max": 2.4},
+     "click_ms": {...}, "sections_ms": {"events": 0.01, "tiles": 0.2, "clock": 0.01, "display": 0.05},
+     "tiles_redrawn": {"mean": 1.5, "max": 256, "total": 90}}
+
+sections_ms are the mean milliseconds per frame spent in each section, click_ms is null
+when there was no click.
+"""
+import json
+import time
+from collections import deque
+
+# the parts of a frame that are timed on their own
+SECTIONS = ('events', 'tiles', 'clock', 'display')
+
+
+def percentiles(values):
+    """returns the 50th, 95th and 99th percentile and the max of values, or None if it is empty
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    last = len(values) - 1
+    return {
+        'p50': values[last * 50 // 100],
+        'p95': values[last * 95 // 100],
+        'p99': values[last * 99 // 100],
+        'max': values[last],
+    }
+
+
+class Profiler(object):
+    """ times frames, clicks and the sections of a frame. keeps the last window frames for the
+    overlay and writes a sample of the frames since the last one every interval seconds
+    """
+    def __init__(self, path=None, interval=1.0, window=300):
+        self.file = open(path, 'a') if path is not None else None
+        self.interval = interval
+
+        # the last window frames, for the overlay
+        self.frames = deque(maxlen=window)
+        self.clicks = deque(maxlen=window)
+        self.tiles = deque(maxlen=window)
+        self.sections = {name: deque(maxlen=window) for name in SECTIONS}
+
+        # the frames since the last sample was written
+        self.sample_frames = []
+        self.sample_clicks = []
+        self.sample_tiles = []
+        self.sample_sections = dict.fromkeys(SECTIONS, 0.0)
+        self.last_write = time.perf_counter()
+
+        # the frame being timed
+        self.frame_start = None
+        self.frame_sections = dict.fromkeys(SECTIONS, 0.0)
+        self.frame_tiles = 0
+
+    def start_frame(self):
+        self.frame_start = time.perf_counter()
+        self.frame_sections = dict.fromkeys(SECTIONS, 0.0)
+        self.frame_tiles = 0
+
+    def call(self, name, function, *args):
+        """calls function(*args) and adds the time it took to the section name of this frame
+        """
+        start = time.perf_counter()
+        result = function(*args)
+        self.frame_sections[name] += time.perf_counter() - start
+        return result
+
+    def count_tiles(self, count):
+        self.frame_tiles += count
+
+    def end_frame(self, clicked=False):
+        """finishes the frame, clicked is set when it handled a mouse click
+        """
+        now = time.perf_counter()
+        if self.frame_start is None:
+            return
+        frame = (now - self.frame_start) * 1000
+        self.frame_start = None
+        self.frames.append(frame)
+        self.sample_frames.append(frame)
+        if clicked:
+            self.clicks.append(frame)
+            self.sample_clicks.append(frame)
+        self.tiles.append(self.frame_tiles)
+        self.sample_tiles.append(self.frame_tiles)
+        for name, seconds in self.frame_sections.items():
+            self.sections[name].append(seconds * 1000)
+            self.sample_sections[name] += seconds * 1000
+
+        if self.file is not None and now - self.last_write >= self.interval:
+            self.write()
+
+    def stats(self):
+        """returns the numbers of the last window frames, in the form of a sample line
+        """
+        frames = len(self.frames)
+        return {
+            'frames': frames,
+            'frame_ms': percentiles(self.frames),
+            'click_ms': percentiles(self.clicks),
+            'sections_ms': {name: sum(times) / max(frames, 1) for name, times in self.sections.items()},
+            'tiles_redrawn': {'mean': sum(self.tiles) / max(frames, 1), 'max': max(self.tiles, default=0),
+                              'total': sum(self.tiles)},
+        }
+
+    def write(self):
+        """appends a sample of the frames since the last one to the metrics file
+        """
+        frames = len(self.sample_frames)
+        if frames:
+            self.file.write(json.dumps({
+                'time': time.time(),
+                'frames': frames,
+                'frame_ms': percentiles(self.sample_frames),
+                'click_ms': percentiles(self.sample_clicks),
+                'sections_ms': {name: total / frames for name, total in self.sample_sections.items()},
+                'tiles_redrawn': {'mean': sum(self.sample_tiles) / frames, 'max': max(self.sample_tiles),
+                                  'total': sum(self.sample_tiles)},
+            }) + '\n')
+            self.file.flush()
+        self.sample_frames = []
+        self.sample_clicks = []
+        self.sample_tiles = []
+        self.sample_sections = dict.fromkeys(SECTIONS, 0.0)
+        self.last_write = time.perf_counter()
+
+    def close(self):
+        """writes the last sample and closes the metrics file
+        """
+        if self.file is not None:
+            self.write()
+            self.file.close()
+            self.file = None
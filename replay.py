@@ -0,0 +1,288 @@
+""" records games as compact binary logs and plays them back, run `python replay.py --help`
+for the options
+
+a log is a HEADER with everything needed to make the same board again, followed by one
+record per move until the end of the file. a record is two varints: the milliseconds since
+the last move, then index * 2 + action where index is row * columns + column and action is
+UNCOVER or FLAG. a move usually takes 3 or 4 bytes, and records are appended as the game is
+played so a crash loses nothing before the last move.
+"""
+import argparse
+import multiprocessing
+import struct
+import sys
+import time
+from array import array
+
+from board import Board
+from chunked import ChunkedBoard
+
+MAGIC = b'MSRP'
+VERSION = 1
+
+# magic, version, flags, rows, columns, mines, seed, density, chunk size, safe row,
+# safe column and the time the game started as a unix timestamp
+HEADER = struct.Struct('<4sBBIIQQdHIId')
+
+# header flags
+CHUNKED = 1
+SAFE = 2
+
+# actions
+UNCOVER = 0
+FLAG = 1
+
+
+def encode_varint(value):
+    """returns value as a little-endian base 128 varint
+    """
+    out = bytearray()
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+    return out
+
+
+def decode_varints(data, start=0):
+    """returns an array of every varint in data from start on
+    """
+    values = array('Q')
+    value = shift = 0
+    for byte in memoryview(data)[start:]:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = shift = 0
+    if shift:
+        raise ValueError("replay ends in the middle of a move")
+    return values
+
+
+class Recorder(object):
+    """ writes the moves of one game to a replay file as they are played
+    """
+    def __init__(self, path, board):
+        self.file = open(path, 'wb')
+        self.num_columns = board.num_columns
+        flags = 0
+        density = 0.0
+        chunk_size = 0
+        if isinstance(board, ChunkedBoard):
+            flags |= CHUNKED
+            density = board.density
+            chunk_size = board.chunk_size
+        safe = board.safe
+        if safe is not None:
+            flags |= SAFE
+        else:
+            safe = (0, 0)
+        self.file.write(HEADER.pack(MAGIC, VERSION, flags, board.num_rows, board.num_columns, board.num_mines,
+                                    board.seed, density, chunk_size, safe[0], safe[1], time.time()))
+        self.start = time.perf_counter()
+
+        # milliseconds since the start of the game at the last move
+        self.last = 0
+
+    def record(self, action, row, column):
+        now = int((time.perf_counter() - self.start) * 1000)
+        self.file.write(encode_varint(now - self.last) + encode_varint((row * self.num_columns + column) * 2 + action))
+        self.last = now
+
+    def uncover(self, row, column):
+        self.record(UNCOVER, row, column)
+
+    def flag(self, row, column):
+        self.record(FLAG, row, column)
+
+    def close(self):
+        self.file.close()
+
+
+class Replay(object):
+    """ a recorded game that can be stepped through, seek() jumps to any move by starting from
+    the nearest snapshot of the board taken every snapshot_interval moves
+    """
+    def __init__(self, data, snapshot_interval=64):
+        (magic, version, flags, self.num_rows, self.num_columns, self.num_mines, self.seed, self.density,
+         self.chunk_size, safe_row, safe_column, self.started) = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("not a replay file")
+        if version != VERSION:
+            raise ValueError(f"replay version {version} is not supported, expected {VERSION}")
+        self.chunked = bool(flags & CHUNKED)
+        self.safe = (safe_row, safe_column) if flags & SAFE else None
+
+        values = decode_varints(data, HEADER.size)
+        # milliseconds since the start of the game of every move, and index * 2 + action
+        self.times = array('Q')
+        total = 0
+        for delay in values[::2]:
+            total += delay
+            self.times.append(total)
+        self.moves = values[1::2]
+        if len(self.moves) != len(self.times):
+            raise ValueError("replay ends in the middle of a move")
+
+        self.snapshot_interval = snapshot_interval
+        self.board = self.new_board()
+        # the number of moves played on self.board
+        self.position = 0
+
+        # snapshots[k] is the board after k * snapshot_interval moves, filled in as moves are played
+        self.snapshots = [self.board.snapshot()]
+
+    @classmethod
+    def load(cls, path, snapshot_interval=64):
+        with open(path, 'rb') as file:
+            return cls(file.read(), snapshot_interval)
+
+    def __len__(self):
+        return len(self.moves)
+
+    def new_board(self):
+        """returns the board the game started with
+        """
+        if self.chunked:
+            return ChunkedBoard(self.num_rows, self.num_columns, self.density, seed=self.seed,
+                                chunk_size=self.chunk_size)
+        return Board(self.num_rows, self.num_columns, self.num_mines, seed=self.seed, safe=self.safe)
+
+    def move(self, n):
+        """returns (milliseconds, action, row, column) for move n
+        """
+        index, action = divmod(self.moves[n], 2)
+        return (self.times[n], action) + divmod(index, self.num_columns)
+
+    def step(self):
+        """plays the next move and returns the indexes of the tiles it uncovered, none for a flag
+        """
+        index, action = divmod(self.moves[self.position], 2)
+        row, column = divmod(index, self.num_columns)
+        if action == FLAG:
+            self.board.flag(row, column)
+            revealed = array('q')
+        else:
+            revealed = self.board.uncover(row, column)
+        self.position += 1
+        if self.position % self.snapshot_interval == 0 and len(self.snapshots) == self.position // self.snapshot_interval:
+            self.snapshots.append(self.board.snapshot())
+        return revealed
+
+    def seek(self, position):
+        """puts the board in the state it was in after position moves and returns it
+        """
+        position = min(max(position, 0), len(self.moves))
+        k = min(position // self.snapshot_interval, len(self.snapshots) - 1)
+        if not k * self.snapshot_interval <= self.position <= position:
+            self.board.restore(self.snapshots[k])
+            self.position = k * self.snapshot_interval
+        while self.position < position:
+            self.step()
+        return self.board
+
+    def run(self):
+        """plays every move and returns the board at the end
+        """
+        return self.seek(len(self.moves))
+
+
+def check_replay(path):
+    """plays a replay headlessly and returns what happened as a dict
+    """
+    replay = Replay.load(path)
+    board = replay.run()
+    return {
+        'path': path,
+        'rows': replay.num_rows,
+        'columns': replay.num_columns,
+        'mines': replay.num_mines,
+        'seed': replay.seed,
+        'moves': len(replay),
+        'seconds': replay.times[-1] / 1000 if len(replay) else 0,
+        'won': board.game_won,
+        'lost': board.game_over,
+    }
+
+
+def play(path, speed=1.0, fps=60):
+    """shows a replay in a window at speed times the recorded pace. SPACE pauses, comma and
+    period step one move back or forward and ESCAPE quits, the board scrolls and zooms as usual
+    """
+    import pygame
+    import Minesweeper
+
+    replay = Replay.load(path)
+    pygame.init()
+    pygame.display.set_caption(f"Minesweeper replay - {path}")
+    game = Minesweeper.Game(fps=fps, wait_when_idle=False, num_rows=replay.num_rows,
+                            num_columns=replay.num_columns, num_mines=replay.num_mines,
+                            density=replay.density if replay.chunked else None, chunk_size=replay.chunk_size or 64)
+    game.tiles = Minesweeper.Tiles(game, board=replay.board)
+    game.gamestate.set_state_game()
+
+    paused = False
+    # the replay time in milliseconds, only moves forward while not paused
+    clock = 0
+    run = True
+    while run:
+        jumped = None
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                run = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_ESCAPE:
+                    run = False
+                elif event.key == pygame.K_SPACE:
+                    paused = not paused
+                elif event.key == pygame.K_COMMA:
+                    jumped = replay.position - 1
+                elif event.key == pygame.K_PERIOD:
+                    jumped = replay.position + 1
+            game.gameeventhandler.view([event])
+
+        if jumped is not None:
+            paused = True
+            replay.seek(jumped)
+            game.tiles.board_changed()
+            clock = replay.times[replay.position - 1] if replay.position else 0
+        elif not paused:
+            clock += game.frame_clock.get_time() * speed
+            while replay.position < len(replay) and replay.times[replay.position] <= clock:
+                game.tiles.dirty.add(replay.moves[replay.position] // 2)
+                game.tiles.uncovered(replay.step())
+
+        game.present()
+        game.frame_clock.tick(game.fps)
+    pygame.quit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('replays', nargs='+', help='replay files to check, or to show with --play')
+    parser.add_argument('--play', action='store_true', help='show the first replay in a window')
+    parser.add_argument('--speed', type=float, default=1.0, help='playback speed for --play')
+    parser.add_argument('--jobs', type=int, default=None, help='worker processes, defaults to the number of cores')
+    args = parser.parse_args()
+
+    if args.play:
+        play(args.replays[0], args.speed)
+        return
+
+    start = time.perf_counter()
+    moves = 0
+    with multiprocessing.Pool(args.jobs) as pool:
+        for result in pool.imap_unordered(check_replay, args.replays, chunksize=64):
+            moves += result['moves']
+            outcome = 'won' if result['won'] else 'lost' if result['lost'] else 'unfinished'
+            print(f"{result['path']}: {result['rows']}x{result['columns']} {result['mines']} mines "
+                  f"seed {result['seed']}, {result['moves']} moves in {result['seconds']:.1f} s, {outcome}")
+    seconds = time.perf_counter() - start
+    print(f"{len(args.replays)} replays, {moves} moves in {seconds:.2f} s, {moves / seconds:.0f} moves/s",
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
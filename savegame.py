@@ -0,0 +1,335 @@
+""" saves and loads games in progress in a bit-packed file format
+
+a save is a HEADER followed by three bit planes: covered, mine and flagged, one bit per tile
+in tile index order, bit j of byte i being tile 8 * i + j. the numbers of adjacent mines
+are worked out again from the mine plane when the board is loaded, so a board takes 3 bits
+per tile, 16x16 is 96 bytes plus the 81 byte header against about 19 KB for a JSON dump of
+the old list of dicts tile_state. run `python benchmark.py save` to compare them.
+
+a chunked.ChunkedBoard is saved as a table of the chunks that have been made followed by
+the three planes of each of those chunks, the rest of the board is made from the seed.
+
+boards with more than MAP_TILES tiles are memory-mapped when they are loaded, and each
+chunk of the board is only decoded from the file when one of its tiles is first read.
+"""
+import mmap
+import os
+import struct
+from itertools import repeat
+from operator import and_, or_
+
+from board import Board, COVERED, FLAGGED, FLAGGED_PLANE, MINE, MINE_PLANE
+from chunked import ChunkedBoard
+
+MAGIC = b'MSSV'
+VERSION = 1
+
+# magic, version, flags, rows, columns, mines, seed, density, chunk size, safe row, safe
+# column, flags placed, covered safe tiles, screen, milliseconds on the clock and chunks
+HEADER = struct.Struct('<4sBBIIQQdHIIQQBQQ')
+
+# header flags
+CHUNKED = 1
+SAFE = 2
+GAME_OVER = 4
+GAME_WON = 8
+CLOCK_STARTED = 16
+
+# the screen the game was on
+TUTORIAL = 0
+GAME = 1
+LOST = 2
+WON = 3
+
+# chunk row and column of every chunk in a chunked save
+CHUNK_ENTRY = struct.Struct('<QQ')
+
+# plain boards with more tiles than this are memory-mapped instead of read when loading
+MAP_TILES = 1 << 20
+
+# translation tables between packed cells and planes of one byte per tile, 0 or 1
+COVERED_PLANE = bytes((cell & COVERED) >> 4 for cell in range(256))
+TO_COVERED = bytes([0, COVERED]) + bytes(254)
+TO_MINE = bytes([0, MINE]) + bytes(254)
+TO_FLAGGED = bytes([0, FLAGGED]) + bytes(254)
+TO_ASCII = b'01' + bytes(254)
+FROM_ASCII = bytes(48) + b'\0\1' + bytes(206)
+
+
+def pack_bits(plane):
+    """packs a plane of one byte per tile, each 0 or 1, into bits
+    """
+    if not plane:
+        return b''
+    # the last tile is the first digit so tile 0 ends up in the lowest bit
+    return int(plane.translate(TO_ASCII)[::-1], 2).to_bytes((len(plane) + 7) // 8, 'little')
+
+
+def unpack_bits(value, count):
+    """returns the count lowest bits of the int value as a plane of one byte per tile
+    """
+    return format(value, 'b').zfill(count)[::-1].encode('ascii')[:count].translate(FROM_ASCII)
+
+
+def read_bits(data, start, count):
+    """returns count bits of data from bit start as a plane of one byte per tile
+    """
+    first = start // 8
+    value = int.from_bytes(data[first:(start + count + 7) // 8], 'little') >> (start - first * 8)
+    return unpack_bits(value & ((1 << count) - 1), count)
+
+
+def write_bits(data, start, plane):
+    """writes a plane of one byte per tile into the bytearray data from bit start
+    """
+    if not plane:
+        return
+    first = start // 8
+    last = (start + len(plane) + 7) // 8
+    shift = start - first * 8
+    mask = ((1 << len(plane)) - 1) << shift
+    value = int.from_bytes(data[first:last], 'little') & ~mask
+    value |= int.from_bytes(pack_bits(plane), 'little') << shift
+    data[first:last] = value.to_bytes(last - first, 'little')
+
+
+def pack_cells(cells):
+    """returns the covered, mine and flagged planes of packed cells as bits
+    """
+    cells = bytes(cells)
+    return (pack_bits(cells.translate(COVERED_PLANE)), pack_bits(cells.translate(MINE_PLANE)),
+            pack_bits(cells.translate(FLAGGED_PLANE)))
+
+
+def unpack_cells(covered, mine, flagged):
+    """returns packed cells, without the adjacent mine counts, from planes of one byte per tile
+    """
+    return bytes(map(or_, map(or_, covered.translate(TO_COVERED), mine.translate(TO_MINE)),
+                     flagged.translate(TO_FLAGGED)))
+
+
+def save(path, board, screen=GAME, elapsed=0, clock_started=False):
+    """saves a board and the state of the game around it, screen is TUTORIAL, GAME, LOST or
+    WON and elapsed the milliseconds on the clock. the file is written next to path and then
+    moved over it so a save that fails half way doesn't destroy the last one
+    """
+    # a LoadedBoard of a big plain save is saved as a plain board again
+    chunked = isinstance(board, ChunkedBoard) and getattr(board, 'chunked_save', True)
+    flags = 0
+    if chunked:
+        flags |= CHUNKED
+    if board.safe is not None:
+        flags |= SAFE
+    if board.game_over:
+        flags |= GAME_OVER
+    if board.game_won:
+        flags |= GAME_WON
+    if clock_started:
+        flags |= CLOCK_STARTED
+    safe = board.safe or (0, 0)
+    if chunked:
+        keys = set(board.chunks)
+        if isinstance(board, LoadedBoard):
+            keys |= set(board.saved_chunks)
+        keys = sorted(keys)
+    else:
+        keys = []
+    header = HEADER.pack(MAGIC, VERSION, flags, board.num_rows, board.num_columns, board.num_mines, board.seed,
+                         getattr(board, 'density', 0.0), getattr(board, 'chunk_size', 0), safe[0], safe[1],
+                         board.num_flags, board.covered_safe, screen, elapsed, len(keys))
+
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(header)
+        if chunked:
+            for key in keys:
+                file.write(CHUNK_ENTRY.pack(*key))
+            for key in keys:
+                if key in board.chunks:
+                    file.write(b''.join(pack_cells(board.chunks[key])))
+                else:
+                    offset, size = board.saved_chunks[key]
+                    file.write(board.mapping[offset:offset + 3 * size])
+        elif isinstance(board, LoadedBoard):
+            for plane in board.copy_planes():
+                file.write(plane)
+        else:
+            for plane in pack_cells(board.cells):
+                file.write(plane)
+    if not isinstance(board, LoadedBoard):
+        os.replace(temporary, path)
+        return
+    # a file that is mapped can't be replaced on windows, the board carries on from the new one
+    board.mapping.close()
+    try:
+        os.replace(temporary, path)
+    except OSError:
+        board.remap(temporary, keys)
+        raise
+    board.remap(path, keys)
+
+
+def load(path):
+    """loads a save and returns (board, screen, elapsed, clock_started), see save(). big boards
+    and chunked boards are a LoadedBoard that decodes the file as it is played
+    """
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size < HEADER.size:
+            raise ValueError("not a save file")
+        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    header = HEADER.unpack_from(mapping)
+    (magic, version, flags, num_rows, num_columns, num_mines, seed, density, chunk_size, safe_row, safe_column,
+     num_flags, covered_safe, screen, elapsed, num_chunks) = header
+    if magic != MAGIC:
+        raise ValueError("not a save file")
+    if version != VERSION:
+        raise ValueError(f"save version {version} is not supported, expected {VERSION}")
+    if flags & CHUNKED and not chunk_size:
+        raise ValueError("a chunked save needs a chunk size")
+    if not flags & CHUNKED and len(mapping) < HEADER.size + 3 * ((num_rows * num_columns + 7) // 8):
+        raise ValueError("the save file is cut short")
+
+    if flags & CHUNKED or num_rows * num_columns > MAP_TILES:
+        board = LoadedBoard(mapping, header)
+    else:
+        tiles = num_rows * num_columns
+        size = (tiles + 7) // 8
+        planes = [
+            unpack_bits(int.from_bytes(mapping[offset:offset + size], 'little'), tiles)
+            for offset in range(HEADER.size, HEADER.size + 3 * size, size)
+        ]
+        mapping.close()
+        board = Board(num_rows, num_columns, num_mines, seed=seed, cells=unpack_cells(*planes))
+    board.safe = (safe_row, safe_column) if flags & SAFE else None
+    return board, screen, elapsed, bool(flags & CLOCK_STARTED)
+
+
+class LoadedBoard(ChunkedBoard):
+    """ a board loaded from a memory-mapped save, a chunk of it is only decoded from the file
+    the first time one of its tiles is read. it holds either a big plain board, where the
+    mines come from the file too, or a chunked board, where they come from the seed
+    """
+    def __init__(self, mapping, header):
+        (magic, version, flags, num_rows, num_columns, num_mines, seed, density, chunk_size, safe_row, safe_column,
+         num_flags, covered_safe, screen, elapsed, num_chunks) = header
+        self.chunked_save = bool(flags & CHUNKED)
+        if not self.chunked_save:
+            density = 0
+            chunk_size = 64
+        ChunkedBoard.__init__(self, num_rows, num_columns, density, seed=seed, chunk_size=chunk_size)
+        self.mapping = mapping
+        self.num_mines = num_mines
+        self.num_flags = num_flags
+        self.covered_safe = covered_safe
+        self.game_over = bool(flags & GAME_OVER)
+        self.game_won = bool(flags & GAME_WON)
+
+        # (chunk row, chunk column) -> (offset, bytes per plane) of the chunks saved in a
+        # chunked save that haven't been decoded yet
+        self.saved_chunks = {}
+        if self.chunked_save:
+            if len(mapping) < HEADER.size + num_chunks * CHUNK_ENTRY.size:
+                raise ValueError("the save file is cut short")
+            self.index_chunks([CHUNK_ENTRY.unpack_from(mapping, HEADER.size + n * CHUNK_ENTRY.size)
+                               for n in range(num_chunks)])
+        else:
+            # bytes in each of the covered, mine and flagged planes of the whole board
+            self.plane_size = (num_rows * num_columns + 7) // 8
+
+    def index_chunks(self, keys):
+        """finds the planes of the chunks in the table of a chunked save, keys, and keeps the
+        ones that haven't been made yet in saved_chunks
+        """
+        size = self.chunk_size
+        offset = HEADER.size + len(keys) * CHUNK_ENTRY.size
+        for chunk_row, chunk_column in keys:
+            if chunk_row * size >= self.num_rows or chunk_column * size >= self.num_columns:
+                raise ValueError(f"the save has a chunk {chunk_row}, {chunk_column} outside the board")
+            rows, columns = self.chunk_shape(chunk_row, chunk_column)
+            planes = (rows * columns + 7) // 8
+            if (chunk_row, chunk_column) not in self.chunks:
+                self.saved_chunks[chunk_row, chunk_column] = (offset, planes)
+            offset += 3 * planes
+        if len(self.mapping) < offset:
+            raise ValueError("the save file is cut short")
+
+    def remap(self, path, keys):
+        """maps the save at path the board was just saved to instead of the one it was loaded
+        from, keys are the chunks in its table
+        """
+        with open(path, 'rb') as file:
+            self.mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.chunked_save:
+            self.saved_chunks = {}
+            self.index_chunks(keys)
+
+    def plane_offset(self, plane):
+        return HEADER.size + plane * self.plane_size
+
+    def chunk_bits(self, chunk_row, chunk_column, plane):
+        """reads one plane of a chunk of a plain save as one byte per tile
+        """
+        size = self.chunk_size
+        rows, columns = self.chunk_shape(chunk_row, chunk_column)
+        offset = self.plane_offset(plane) * 8
+        return b''.join([
+            read_bits(self.mapping, offset + (chunk_row * size + row) * self.num_columns + chunk_column * size, columns)
+            for row in range(rows)
+        ])
+
+    def chunk_mines(self, chunk_row, chunk_column):
+        if self.chunked_save:
+            return ChunkedBoard.chunk_mines(self, chunk_row, chunk_column)
+        key = (chunk_row, chunk_column)
+        mines = self.mine_cache.get(key)
+        if mines is None:
+            plane = self.chunk_bits(chunk_row, chunk_column, 1)
+            mines = [i for i, mine in enumerate(plane) if mine]
+            if len(self.mine_cache) >= 4096:
+                self.mine_cache.clear()
+            self.mine_cache[key] = mines
+        return mines
+
+    def make_chunk(self, chunk_row, chunk_column):
+        """returns the cells of a chunk with the covered and flagged tiles of the save
+        """
+        cells = ChunkedBoard.make_chunk(self, chunk_row, chunk_column)
+        if self.chunked_save:
+            saved = self.saved_chunks.pop((chunk_row, chunk_column), None)
+            if saved is None:
+                return cells
+            offset, size = saved
+            count = len(cells)
+            covered = read_bits(self.mapping, offset * 8, count)
+            flagged = read_bits(self.mapping, (offset + 2 * size) * 8, count)
+        else:
+            covered = self.chunk_bits(chunk_row, chunk_column, 0)
+            flagged = self.chunk_bits(chunk_row, chunk_column, 2)
+        state = map(or_, covered.translate(TO_COVERED), flagged.translate(TO_FLAGGED))
+        cells[:] = bytes(map(or_, map(and_, cells, repeat(~(COVERED | FLAGGED) & 0xFF)), state))
+        return cells
+
+    def copy_planes(self):
+        """returns the three planes of a plain save with the chunks changed since loading
+        written into them
+        """
+        planes = [bytearray(self.mapping[self.plane_offset(plane):self.plane_offset(plane + 1)]) for plane in range(3)]
+        size = self.chunk_size
+        for (chunk_row, chunk_column), cells in self.chunks.items():
+            columns = self.chunk_shape(chunk_row, chunk_column)[1]
+            cells = bytes(cells)
+            for plane, table in zip(planes, (COVERED_PLANE, MINE_PLANE, FLAGGED_PLANE)):
+                bits = cells.translate(table)
+                for row in range(len(cells) // columns):
+                    start = (chunk_row * size + row) * self.num_columns + chunk_column * size
+                    write_bits(plane, start, bits[row * columns:(row + 1) * columns])
+        return planes
+
+    def check_counters(self):
+        """tiles that haven't been decoded yet can be in any state, so this only checks anything
+        once every saved tile has been decoded
+        """
+        size = self.chunk_size
+        total = -(-self.num_rows // size) * -(-self.num_columns // size)
+        if (not self.saved_chunks) if self.chunked_save else len(self.chunks) == total:
+            ChunkedBoard.check_counters(self)
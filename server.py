@@ -0,0 +1,388 @@
+""" hosts many games at once from one process, run `python server.py --help` for the options
+and `python Minesweeper.py --connect ADDRESS` to play on it
+
+the server listens on HOST:PORT or unix:PATH and speaks JSON, one object per line each
+way. every request gets one reply, an {"error": ...} when it can't be done:
+
+    {"op": "new", "rows": 16, "columns": 16, "mines": 40}   starts a session
+    {"op": "attach", "session": ID}                         carries on with a session
+    {"op": "uncover", "row": 3, "column": 4}
+    {"op": "flag", "row": 3, "column": 4}
+    {"op": "metrics"}
+
+new and attach reply with the whole board as the player sees it, uncover and flag only
+with the tiles they changed as [index, cell] pairs. a covered cell is sent without its
+mine bit and its number, so the client can't see where the mines are. a session is a
+board.Board of one byte per tile, sessions that weren't used for --idle seconds are
+saved in the --data directory with savegame.py and loaded again when they are attached.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import re
+import secrets
+import signal
+import socket
+import struct
+import sys
+import time
+from collections import deque
+
+from board import Board, COVERED, FLAGGED, FLAGGED_PLANE
+from profiler import percentiles
+import savegame
+
+# what the player sees of a packed cell, covered tiles keep only their covered and flag bits
+VISIBLE = bytes(cell & (COVERED | FLAGGED) if cell & COVERED else cell for cell in range(256))
+
+# the biggest board a session can have, bigger saves would be memory-mapped when loaded
+MAX_TILES = savegame.MAP_TILES
+
+# what a session id looks like, it is used as a file name
+SESSION_ID = re.compile(r'[0-9a-f]{16}')
+
+
+def parse_address(address):
+    """returns (family, address) for a HOST:PORT or unix:PATH address
+    """
+    if address.startswith('unix:'):
+        return socket.AF_UNIX, address[len('unix:'):]
+    host, separator, port = address.rpartition(':')
+    if not separator:
+        raise ValueError(f"address {address!r} is not HOST:PORT or unix:PATH")
+    return socket.AF_INET, (host or '127.0.0.1', int(port))
+
+
+class Session(object):
+    """ one game on the server, the clock starts at the first uncover and stops when the
+    game is over
+    """
+    def __init__(self, session_id, board, elapsed=0, started=False):
+        self.id = session_id
+        self.board = board
+        self.last_used = time.monotonic()
+
+        # monotonic time the clock started at while it runs, the milliseconds on it otherwise
+        self.started = time.monotonic() - elapsed / 1000 if started else None
+        self.elapsed = elapsed
+
+    def elapsed_ms(self):
+        if self.started is None:
+            return self.elapsed
+        return int((time.monotonic() - self.started) * 1000)
+
+    def state(self):
+        """returns the reply to new and attach
+        """
+        board = self.board
+        return {
+            'session': self.id,
+            'rows': board.num_rows,
+            'columns': board.num_columns,
+            'mines': board.num_mines,
+            'cells': base64.b64encode(board.cells.translate(VISIBLE)).decode('ascii'),
+            'elapsed': self.elapsed_ms(),
+            'running': self.started is not None,
+            **self.counters(),
+        }
+
+    def counters(self):
+        board = self.board
+        return {
+            'flags': board.num_flags,
+            'covered_safe': board.covered_safe,
+            'game_over': board.game_over,
+            'game_won': board.game_won,
+        }
+
+    def uncover(self, row, column):
+        board = self.board
+        if self.started is None and not board.game_over and not board.game_won:
+            self.started = time.monotonic()
+        revealed = board.uncover(row, column)
+        if self.started is not None and (board.game_over or board.game_won):
+            self.elapsed = self.elapsed_ms()
+            self.started = None
+        return revealed
+
+    def flag(self, row, column):
+        board = self.board
+        if not board.in_bounds(row, column):
+            return []
+        board.flag(row, column)
+        return [board.index(row, column)]
+
+
+class Server(object):
+    """ keeps the sessions and answers the requests of every connection
+    """
+    def __init__(self, data_dir, idle=300.0, latency_window=10000):
+        self.data_dir = data_dir
+        self.idle = idle
+
+        # sessions in memory by id, the others are saved in data_dir
+        self.sessions = {}
+        self.evictions = 0
+
+        # milliseconds the last latency_window requests took to handle
+        self.latencies = deque(maxlen=latency_window)
+        self.requests = 0
+        self.connections = 0
+
+    def path(self, session_id):
+        return os.path.join(self.data_dir, session_id + '.sav')
+
+    def new(self, request):
+        num_rows = int(request['rows'])
+        num_columns = int(request['columns'])
+        if num_rows <= 0 or num_columns <= 0 or num_rows * num_columns > MAX_TILES:
+            raise ValueError(f"boards can have 1 to {MAX_TILES} tiles")
+        board = Board(num_rows, num_columns, int(request['mines']))
+        session = Session(secrets.token_hex(8), board)
+        self.sessions[session.id] = session
+        return session
+
+    def session(self, session_id):
+        """returns the session session_id, loading it from disk when it was evicted
+        """
+        session = self.sessions.get(session_id)
+        if session is not None:
+            return session
+        if not isinstance(session_id, str) or not SESSION_ID.fullmatch(session_id):
+            raise ValueError(f"no session {session_id!r}")
+        path = self.path(session_id)
+        if not os.path.exists(path):
+            raise ValueError(f"no session {session_id!r}")
+        try:
+            board, screen, elapsed, started = savegame.load(path)
+        except (ValueError, struct.error, OSError) as error:
+            raise ValueError(f"session {session_id!r} can't be loaded: {error}")
+        os.remove(path)
+        session = self.sessions[session_id] = Session(session_id, board, elapsed, started)
+        return session
+
+    def evict(self, session):
+        """saves a session to disk and forgets it
+        """
+        board = session.board
+        screen = savegame.LOST if board.game_over else savegame.WON if board.game_won else savegame.GAME
+        savegame.save(self.path(session.id), board, screen, session.elapsed_ms(), session.started is not None)
+        del self.sessions[session.id]
+        self.evictions += 1
+
+    def evict_idle(self):
+        """evicts every session that wasn't used for idle seconds, returns how many
+        """
+        now = time.monotonic()
+        idle = [session for session in self.sessions.values() if now - session.last_used >= self.idle]
+        for session in idle:
+            self.evict(session)
+        return len(idle)
+
+    def metrics(self):
+        memory = sum(len(session.board.cells) for session in self.sessions.values())
+        try:
+            import resource
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        except ImportError:
+            rss = None
+        return {
+            'sessions': len(self.sessions),
+            'evicted': sum(1 for name in os.listdir(self.data_dir) if name.endswith('.sav')),
+            'evictions': self.evictions,
+            'connections': self.connections,
+            'requests': self.requests,
+            'board_bytes': memory,
+            'max_rss_bytes': rss,
+            'latency_ms': percentiles(self.latencies),
+        }
+
+    def handle(self, request, current):
+        """returns (reply, session) for a request from a connection that is playing current
+        """
+        if not isinstance(request, dict):
+            raise ValueError("a request is a JSON object")
+        op = request.get('op')
+        if op == 'metrics':
+            return self.metrics(), current
+        if op == 'new':
+            session = self.new(request)
+            return session.state(), session
+        if op == 'attach':
+            session = self.session(request.get('session'))
+            session.last_used = time.monotonic()
+            return session.state(), session
+        if op in ('uncover', 'flag'):
+            if current is None:
+                raise ValueError("start or attach a session first")
+            # the session may have been evicted while the player was away
+            session = self.session(current.id)
+            session.last_used = time.monotonic()
+            row = int(request['row'])
+            column = int(request['column'])
+            changed = session.uncover(row, column) if op == 'uncover' else session.flag(row, column)
+            cells = session.board.cells
+            return {'changed': [[i, VISIBLE[cells[i]]] for i in changed], **session.counters()}, session
+        raise ValueError(f"unknown op {op!r}")
+
+    async def serve_client(self, reader, writer):
+        self.connections += 1
+        session = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                start = time.perf_counter()
+                try:
+                    reply, session = self.handle(json.loads(line), session)
+                except (ValueError, KeyError, TypeError, OverflowError) as error:
+                    reply = {'error': str(error)}
+                writer.write(json.dumps(reply, separators=(',', ':')).encode() + b'\n')
+                self.requests += 1
+                self.latencies.append((time.perf_counter() - start) * 1000)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            # the connection went away or the server is stopping
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def evict_loop(self):
+        while True:
+            await asyncio.sleep(max(self.idle / 4, 0.1))
+            self.evict_idle()
+
+    async def serve(self, address):
+        """answers requests on address until it is cancelled, then saves every session
+        """
+        os.makedirs(self.data_dir, exist_ok=True)
+        family, address = parse_address(address)
+        if family == socket.AF_UNIX:
+            server = await asyncio.start_unix_server(self.serve_client, address)
+        else:
+            server = await asyncio.start_server(self.serve_client, *address)
+        evictor = asyncio.ensure_future(self.evict_loop())
+        # being stopped saves the sessions like CTRL+C does
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        except NotImplementedError:
+            pass
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            evictor.cancel()
+            for session in list(self.sessions.values()):
+                self.evict(session)
+
+
+class Connection(object):
+    """ a blocking connection to a server, for the game's client mode
+    """
+    def __init__(self, address):
+        family, address = parse_address(address)
+        if family == socket.AF_UNIX:
+            self.socket = socket.socket(socket.AF_UNIX)
+            self.socket.connect(address)
+        else:
+            self.socket = socket.create_connection(address)
+        self.file = self.socket.makefile('rwb')
+
+    def request(self, op, **arguments):
+        """sends a request and returns the reply, raises ValueError when the server refused it
+        """
+        self.file.write(json.dumps({'op': op, **arguments}).encode() + b'\n')
+        self.file.flush()
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("the server closed the connection")
+        reply = json.loads(line)
+        if 'error' in reply:
+            raise ValueError(reply['error'])
+        return reply
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+
+class RemoteBoard(Board):
+    """ a board played on a server, it only knows what the player can see so the cells of
+    covered tiles have no mine bit and no number
+    """
+    def __init__(self, connection, state):
+        self.connection = connection
+        self.session = state['session']
+        self.num_rows = state['rows']
+        self.num_columns = state['columns']
+        self.num_mines = state['mines']
+        self.cells = bytearray(base64.b64decode(state['cells']))
+        self.elapsed = state['elapsed']
+        self.running = state['running']
+        self.seed = None
+        self.safe = None
+        self.init_counters()
+        self.update(state)
+
+    @classmethod
+    def new(cls, connection, num_rows, num_columns, num_mines):
+        return cls(connection, connection.request('new', rows=num_rows, columns=num_columns, mines=num_mines))
+
+    @classmethod
+    def attach(cls, connection, session):
+        return cls(connection, connection.request('attach', session=session))
+
+    def update(self, reply):
+        """applies the changed cells and the counters of a reply
+        """
+        cells = self.cells
+        for i, cell in reply.get('changed', ()):
+            cells[i] = cell
+        self.num_flags = reply['flags']
+        self.covered_safe = reply['covered_safe']
+        self.game_over = reply['game_over']
+        self.game_won = reply['game_won']
+
+    def uncover(self, row, column):
+        reply = self.connection.request('uncover', row=row, column=column)
+        self.update(reply)
+        return [i for i, cell in reply['changed']]
+
+    def flag(self, row, column):
+        self.update(self.connection.request('flag', row=row, column=column))
+
+    def check_counters(self):
+        """only the flags can be counted, the client doesn't know which covered tiles are safe
+        """
+        num_flags = self.cells.translate(FLAGGED_PLANE).count(1)
+        if num_flags != self.num_flags:
+            raise AssertionError(f"num_flags is {self.num_flags} but the board has {num_flags}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('address', help='HOST:PORT or unix:PATH to listen on')
+    parser.add_argument('--data', default='sessions', help='directory idle sessions are saved in')
+    parser.add_argument('--idle', type=float, default=300, help='seconds before an unused session is saved to disk')
+    parser.add_argument('--metrics', action='store_true', help='print the metrics of the server at address and quit')
+    args = parser.parse_args()
+
+    if args.metrics:
+        connection = Connection(args.address)
+        print(json.dumps(connection.request('metrics'), indent=1))
+        connection.close()
+        return
+
+    server = Server(args.data, args.idle)
+    try:
+        asyncio.run(server.serve(args.address))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        print(f"saved {server.evictions} sessions in {args.data}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+""" plays many headless games with an automatic player across a process pool and writes one
+result per game, run `python simulate.py --help` for the options
+
+a strategy is a function strategy(board, rng) that returns ('uncover', row, column) or
+('flag', row, column) for the next move. use one of the names in STRATEGIES, or any
+module-level function as 'module:function'
+"""
+import argparse
+import csv
+import importlib
+import json
+import multiprocessing
+import random
+import sys
+import time
+import weakref
+
+from board import Board, COVERED, FLAGGED
+from solver import Solver
+
+
+def random_strategy(board, rng):
+    """uncovers a random covered tile that isn't flagged
+    """
+    cells = board.cells
+    for attempt in range(32):
+        i = rng.randrange(len(cells))
+        if cells[i] & (COVERED | FLAGGED) == COVERED:
+            return ('uncover',) + divmod(i, board.num_columns)
+    # the board is almost finished, so pick from the tiles that are left instead of guessing
+    left = [i for i in range(len(cells)) if cells[i] & (COVERED | FLAGGED) == COVERED]
+    return ('uncover',) + divmod(rng.choice(left), board.num_columns)
+
+
+# the solver and last move of each board solver_strategy is playing in this process
+solvers = weakref.WeakKeyDictionary()
+
+
+def solver_strategy(board, rng):
+    """uncovers a tile solver.Solver proved safe, or the one least likely to be a mine
+    """
+    player = solvers.get(board)
+    if player is None:
+        player = solvers[board] = [Solver(board), None]
+    solver, last_move = player
+    if last_move is not None:
+        solver.update_from(last_move)
+    move = solver.best_move(rng)
+    player[1] = board.index(move[1], move[2])
+    return move
+
+
+STRATEGIES = {
+    'random': random_strategy,
+    'solver': solver_strategy,
+}
+
+FIELDS = ['game', 'seed', 'rows', 'columns', 'mines', 'strategy', 'won', 'clicks', 'flags', 'revealed', 'duration']
+
+
+def load_strategy(name):
+    """returns the strategy function for a name in STRATEGIES or a 'module:function' path
+    """
+    if name in STRATEGIES:
+        return STRATEGIES[name]
+    module, separator, function = name.partition(':')
+    if not separator:
+        raise ValueError(f"unknown strategy {name!r}, use one of {sorted(STRATEGIES)} or module:function")
+    return getattr(importlib.import_module(module), function)
+
+
+def play_game(num_rows, num_columns, num_mines, seed, strategy, max_moves=None):
+    """plays one game to the end and returns what happened as a dict. the board and the
+    strategy's random numbers both come from seed, so a game can be played again exactly
+    """
+    start = time.perf_counter()
+    board = Board(num_rows, num_columns, num_mines, seed=seed)
+    # the player must not draw the same random numbers that placed the mines
+    rng = random.Random(f"player {seed}")
+    clicks = flags = 0
+    if max_moves is None:
+        max_moves = 4 * num_rows * num_columns
+    while not board.game_over and not board.game_won and clicks < max_moves:
+        action, row, column = strategy(board, rng)
+        clicks += 1
+        if action == 'flag':
+            board.flag(row, column)
+            flags += 1
+        else:
+            board.uncover(row, column)
+    return {
+        'seed': seed,
+        'rows': num_rows,
+        'columns': num_columns,
+        'mines': num_mines,
+        'won': board.game_won,
+        'clicks': clicks,
+        'flags': flags,
+        'revealed': num_rows * num_columns - num_mines - board.covered_safe,
+        'duration': time.perf_counter() - start,
+    }
+
+
+# the strategy used by this worker process, set by init_worker
+worker_strategy = None
+
+
+def init_worker(strategy_name):
+    global worker_strategy
+    worker_strategy = load_strategy(strategy_name)
+
+
+def play_job(job):
+    """runs one game in a worker process, job is (game number, rows, columns, mines, seed)
+    """
+    game, num_rows, num_columns, num_mines, seed = job
+    result = play_game(num_rows, num_columns, num_mines, seed, worker_strategy)
+    result['game'] = game
+    return result
+
+
+class ResultWriter(object):
+    """ writes one game result per line as JSON lines or CSV
+    """
+    def __init__(self, file, format, strategy):
+        self.file = file
+        self.strategy = strategy
+        if format == 'csv':
+            self.csv = csv.DictWriter(file, FIELDS)
+            self.csv.writeheader()
+        else:
+            self.csv = None
+
+    def write(self, result):
+        result['strategy'] = self.strategy
+        if self.csv is not None:
+            self.csv.writerow(result)
+        else:
+            self.file.write(json.dumps({field: result[field] for field in FIELDS}) + '\n')
+
+
+def run(args, output):
+    """plays args.games games across args.jobs processes and streams the results to output,
+    returns (games, wins, seconds)
+    """
+    jobs = ((game, args.rows, args.columns, args.mines, args.seed + game) for game in range(args.games))
+    writer = ResultWriter(output, args.format, args.strategy)
+    wins = 0
+    start = time.perf_counter()
+    with multiprocessing.Pool(args.jobs, initializer=init_worker, initargs=(args.strategy,)) as pool:
+        for result in pool.imap_unordered(play_job, jobs, chunksize=args.chunksize):
+            writer.write(result)
+            wins += result['won']
+    return args.games, wins, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('games', type=int, help='number of games to play')
+    parser.add_argument('--rows', type=int, default=16)
+    parser.add_argument('--columns', type=int, default=16)
+    parser.add_argument('--mines', type=int, default=40)
+    parser.add_argument('--strategy', default='random', help=f"one of {sorted(STRATEGIES)} or module:function")
+    parser.add_argument('--seed', type=int, default=0, help='game n is played with seed + n')
+    parser.add_argument('--jobs', type=int, default=None, help='worker processes, defaults to the number of cores')
+    parser.add_argument('--chunksize', type=int, default=64, help='games sent to a worker at a time')
+    parser.add_argument('--output', default='-', help='file to write results to, - for stdout')
+    parser.add_argument('--format', choices=['jsonl', 'csv'], default=None,
+                        help='defaults to csv for .csv files and jsonl otherwise')
+    args = parser.parse_args()
+    if args.format is None:
+        args.format = 'csv' if args.output.endswith('.csv') else 'jsonl'
+    load_strategy(args.strategy)
+
+    if args.output == '-':
+        games, wins, seconds = run(args, sys.stdout)
+    else:
+        with open(args.output, 'w', newline='') as output:
+            games, wins, seconds = run(args, output)
+    print(f"{games} games in {seconds:.2f} s, {games / seconds:.0f} games/s, {wins / max(games, 1):.1%} won",
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,428 @@
+""" minesweeper solver that works on a board.Board, used for the hint overlay and automatic play
+
+every uncovered number next to covered tiles gives a constraint: this many of these covered
+tiles are mines. the solver first applies the simple rules (a constraint that needs no more
+mines makes all its tiles safe, one that needs all of them makes them all mines, and a
+constraint inside another one settles the tiles left over), then splits the remaining
+constraints into components that share no tiles and enumerates every arrangement of mines
+in each one to get exact probabilities. components are cached by their constraints, so
+after a click only the components that click changed are enumerated again.
+
+flags are ignored, the player may have placed them wrongly.
+"""
+import math
+
+from board import ADJACENT, COVERED, MINE
+
+
+class Analysis(object):
+    """ what the solver worked out about the covered tiles of a board
+    """
+    def __init__(self, safe, mines, probabilities, rest_probability, exact):
+        # indexes of covered tiles that can't be mines
+        self.safe = safe
+
+        # indexes of covered tiles that must be mines
+        self.mines = mines
+
+        # chance of a mine for each covered tile next to a number that isn't known
+        self.probabilities = probabilities
+
+        # chance of a mine for every other covered tile
+        self.rest_probability = rest_probability
+
+        # False when a component was too big to enumerate and was estimated
+        self.exact = exact
+
+    def probability(self, index):
+        """returns the chance that the covered tile at index is a mine
+        """
+        if index in self.safe:
+            return 0.0
+        if index in self.mines:
+            return 1.0
+        return self.probabilities.get(index, self.rest_probability)
+
+
+class Solver(object):
+    """ keeps track of the numbered tiles next to covered tiles and solves the board from them
+    """
+    def __init__(self, board, max_component=40, cache_size=4096):
+        """ components with more than max_component tiles are estimated instead of enumerated,
+        and at most cache_size component results are kept
+        """
+        self.board = board
+        self.max_component = max_component
+        self.cache_size = cache_size
+        self.cache = {}
+
+        # uncovered numbers that may still have covered neighbours
+        self.frontier = set()
+
+        # tiles the solver has proven, they stay known until they are uncovered
+        self.known_mines = set()
+        self.known_safe = set()
+
+        # every uncovered tile the solver has already looked at, a set so it only grows with the
+        # tiles uncovered and not with the board, which can be a huge chunked.ChunkedBoard
+        self.seen = set()
+        self.update(board.uncovered_tiles())
+
+    def neighbours(self, index):
+        """returns the indexes of the tiles around index
+        """
+        num_rows = self.board.num_rows
+        num_columns = self.board.num_columns
+        row, column = divmod(index, num_columns)
+        return [
+            r * num_columns + c
+            for r in range(max(row - 1, 0), min(row + 2, num_rows))
+            for c in range(max(column - 1, 0), min(column + 2, num_columns))
+            if r != row or c != column
+        ]
+
+    def update(self, revealed):
+        """tells the solver which tiles were uncovered, as returned by Board.uncover
+        """
+        cells = self.board.cells
+        seen = self.seen
+        for i in revealed:
+            seen.add(i)
+            self.known_safe.discard(i)
+            if cells[i] & ADJACENT and not cells[i] & MINE:
+                self.frontier.add(i)
+
+    def update_from(self, index):
+        """finds the tiles uncovered by a click on index without being told, by following the
+        newly uncovered tiles out from it the way the flood reveal spread
+        """
+        cells = self.board.cells
+        seen = self.seen
+        revealed = []
+        stack = [index]
+        while stack:
+            i = stack.pop()
+            if i in seen or cells[i] & COVERED:
+                continue
+            seen.add(i)
+            revealed.append(i)
+            if cells[i] & ADJACENT == 0:
+                stack.extend(self.neighbours(i))
+        self.update(revealed)
+
+    def constraints(self):
+        """returns {frozenset of covered tile indexes: number of mines among them} for every
+        frontier number, leaving out tiles that are already known
+        """
+        cells = self.board.cells
+        constraints = {}
+        stale = []
+        for i in self.frontier:
+            need = cells[i] & ADJACENT
+            unknown = []
+            for j in self.neighbours(i):
+                if cells[j] & COVERED:
+                    if j in self.known_mines:
+                        need -= 1
+                    elif j not in self.known_safe:
+                        unknown.append(j)
+            if unknown:
+                constraints[frozenset(unknown)] = need
+            else:
+                stale.append(i)
+        self.frontier.difference_update(stale)
+        return constraints
+
+    def apply_rules(self, constraints):
+        """applies the single constraint and subset rules until they find nothing new, adding
+        what they prove to known_safe and known_mines, and returns the constraints that are left
+        """
+        while True:
+            safe = set()
+            mines = set()
+            for tiles, need in constraints.items():
+                if need == 0:
+                    safe |= tiles
+                elif need == len(tiles):
+                    mines |= tiles
+
+            if not safe and not mines:
+                by_tile = {}
+                for tiles in constraints:
+                    for tile in tiles:
+                        by_tile.setdefault(tile, []).append(tiles)
+                for small, small_need in constraints.items():
+                    for big in by_tile[next(iter(small))]:
+                        if len(big) > len(small) and small < big:
+                            left = big - small
+                            left_need = constraints[big] - small_need
+                            if left_need == 0:
+                                safe |= left
+                            elif left_need == len(left):
+                                mines |= left
+
+            if not safe and not mines:
+                return constraints
+            self.known_safe |= safe
+            self.known_mines |= mines
+            reduced = {}
+            for tiles, need in constraints.items():
+                left = tiles - safe - mines
+                if left:
+                    reduced[left] = need - len(tiles & mines)
+            constraints = reduced
+
+    def components(self, constraints):
+        """splits the constraints into groups that share no tiles, returns a list of
+        (tiles, constraints) pairs
+        """
+        parent = {}
+
+        def find(tile):
+            while parent[tile] != tile:
+                parent[tile] = parent[parent[tile]]
+                tile = parent[tile]
+            return tile
+
+        for tiles in constraints:
+            for tile in tiles:
+                parent.setdefault(tile, tile)
+            first = find(next(iter(tiles)))
+            for tile in tiles:
+                root = find(tile)
+                if root != first:
+                    parent[root] = first
+
+        groups = {}
+        for tiles, need in constraints.items():
+            groups.setdefault(find(next(iter(tiles))), {})[tiles] = need
+        components = []
+        for group in groups.values():
+            tiles = set()
+            for constraint in group:
+                tiles |= constraint
+            components.append((tiles, group))
+        return components
+
+    def enumerate_component(self, tiles, constraints):
+        """counts every arrangement of mines that meets the constraints, returns the tile order
+        and {mines in the component: [arrangements, [arrangements with a mine on each tile]]}
+        """
+        # visit tiles in the order the constraints connect them so constraints fill up early
+        # and bad arrangements are cut off as soon as possible
+        by_tile = {}
+        for constraint in constraints:
+            for tile in constraint:
+                by_tile.setdefault(tile, []).append(constraint)
+        order = []
+        placed = set()
+        for start in sorted(tiles):
+            if start in placed:
+                continue
+            placed.add(start)
+            queue = [start]
+            while queue:
+                tile = queue.pop(0)
+                order.append(tile)
+                for constraint in by_tile[tile]:
+                    for other in sorted(constraint):
+                        if other not in placed:
+                            placed.add(other)
+                            queue.append(other)
+
+        position = {tile: i for i, tile in enumerate(order)}
+        constraint_list = list(constraints.items())
+        need = [count for tiles, count in constraint_list]
+        unassigned = [len(tiles) for tiles, count in constraint_list]
+        assigned = [0] * len(constraint_list)
+        tile_constraints = [[] for tile in order]
+        for c, (constraint, count) in enumerate(constraint_list):
+            for tile in constraint:
+                tile_constraints[position[tile]].append(c)
+
+        size = len(order)
+        value = [0] * size
+        counts = {}
+
+        def visit(i, mines):
+            if i == size:
+                entry = counts.get(mines)
+                if entry is None:
+                    entry = counts[mines] = [0, [0] * size]
+                entry[0] += 1
+                per_tile = entry[1]
+                for t in range(size):
+                    if value[t]:
+                        per_tile[t] += 1
+                return
+            touched = tile_constraints[i]
+            for v in (0, 1):
+                for c in touched:
+                    total = assigned[c] + v
+                    if total > need[c] or total + unassigned[c] - 1 < need[c]:
+                        break
+                else:
+                    for c in touched:
+                        assigned[c] += v
+                        unassigned[c] -= 1
+                    value[i] = v
+                    visit(i + 1, mines + v)
+                    for c in touched:
+                        assigned[c] -= v
+                        unassigned[c] += 1
+            value[i] = 0
+
+        visit(0, 0)
+        return order, counts
+
+    def estimate_component(self, tiles, constraints):
+        """a rough answer for a component too big to enumerate, each tile gets the highest
+        mine density of the constraints it is in
+        """
+        order = sorted(tiles)
+        chance = dict.fromkeys(order, 0.0)
+        for constraint, need in constraints.items():
+            density = need / len(constraint)
+            for tile in constraint:
+                chance[tile] = max(chance[tile], density)
+        mines = round(sum(chance.values()))
+        return order, {mines: [1.0, [chance[tile] for tile in order]]}
+
+    def solve_component(self, tiles, constraints):
+        """returns the enumeration of a component, from the cache when the same constraints
+        were solved before
+        """
+        key = frozenset(constraints.items())
+        result = self.cache.get(key)
+        if result is None:
+            if len(tiles) > self.max_component:
+                result = self.estimate_component(tiles, constraints) + (False,)
+            else:
+                result = self.enumerate_component(tiles, constraints) + (True,)
+            if len(self.cache) >= self.cache_size:
+                self.cache.clear()
+            self.cache[key] = result
+        return result
+
+    def solve(self):
+        """works out which covered tiles are safe, which are mines and the chance of a mine for
+        the rest, and returns an Analysis
+        """
+        board = self.board
+        constraints = self.apply_rules(self.constraints())
+        components = [self.solve_component(tiles, group) for tiles, group in self.components(constraints)]
+        exact = all(component[2] for component in components)
+
+        # every covered tile that is not known and not next to a number
+        frontier_tiles = sum(len(component[0]) for component in components)
+        unknown = board.covered_safe + board.num_mines - len(self.known_safe) - len(self.known_mines)
+        rest = unknown - frontier_tiles
+        mines_left = board.num_mines - len(self.known_mines)
+
+        # distribution of the number of mines over all the components together, and without
+        # each component, so each one can be weighed by the arrangements of all the others
+        distributions = [{mines: entry[0] for mines, entry in component[1].items()} for component in components]
+        before = [{0: 1}]
+        for distribution in distributions:
+            before.append(convolve(before[-1], distribution))
+        after = [{0: 1}]
+        for distribution in reversed(distributions):
+            after.append(convolve(after[-1], distribution))
+        after.reverse()
+
+        # the rest of the tiles can hold the remaining mines in comb(rest, mines) ways, these are
+        # huge numbers on big boards so they are worked out as logarithms and scaled so the
+        # biggest one is 1
+        logs = []
+        for frontier_mines in range(frontier_tiles + 1):
+            rest_mines = mines_left - frontier_mines
+            if 0 <= rest_mines <= rest:
+                logs.append(math.lgamma(rest + 1) - math.lgamma(rest_mines + 1) - math.lgamma(rest - rest_mines + 1))
+            else:
+                logs.append(None)
+        top = max((value for value in logs if value is not None), default=0.0)
+        weight = [0.0 if value is None else math.exp(value - top) for value in logs]
+
+        total = sum(count * weight[mines] for mines, count in before[-1].items())
+        probabilities = {}
+        if total > 0:
+            for c, (order, counts, component_exact) in enumerate(components):
+                others = convolve(before[c], after[c + 1])
+                chance = [0.0] * len(order)
+                for mines, (arrangements, per_tile) in counts.items():
+                    # weight of one arrangement of this component with this many mines
+                    scale = sum(count * weight[mines + other] for other, count in others.items())
+                    for t in range(len(order)):
+                        chance[t] += per_tile[t] * scale
+                for t, tile in enumerate(order):
+                    probabilities[tile] = chance[t] / total
+            expected_rest = sum(count * weight[mines] * (mines_left - mines)
+                                for mines, count in before[-1].items()) / total
+        else:
+            expected_rest = mines_left
+        rest_probability = expected_rest / rest if rest > 0 else 0.0
+
+        safe = set(self.known_safe)
+        mines = set(self.known_mines)
+        for tile, chance in list(probabilities.items()):
+            if exact and chance <= 1e-12:
+                safe.add(tile)
+                del probabilities[tile]
+            elif exact and chance >= 1 - 1e-12:
+                mines.add(tile)
+                del probabilities[tile]
+        return Analysis(safe, mines, probabilities, rest_probability, exact)
+
+    def best_move(self, rng=None):
+        """returns ('uncover', row, column) for a tile that is safe if there is one, otherwise
+        for the tile least likely to be a mine
+        """
+        num_columns = self.board.num_columns
+        if self.known_safe:
+            # tiles proven safe by an earlier solve can be played without solving again
+            return ('uncover',) + divmod(min(self.known_safe), num_columns)
+        analysis = self.solve()
+        if analysis.safe:
+            return ('uncover',) + divmod(min(analysis.safe), num_columns)
+        choice = None
+        if analysis.probabilities:
+            choice = min(analysis.probabilities, key=analysis.probabilities.get)
+            if analysis.probabilities[choice] <= analysis.rest_probability:
+                return ('uncover',) + divmod(choice, num_columns)
+        rest = self.rest_tile(analysis, rng)
+        if rest is not None:
+            return ('uncover',) + divmod(rest, num_columns)
+        return ('uncover',) + divmod(choice, num_columns)
+
+    def rest_tile(self, analysis, rng=None):
+        """returns a covered tile that isn't next to a number or known, preferring corners,
+        or None if there isn't one
+        """
+        board = self.board
+        cells = board.cells
+        last_row = board.num_rows - 1
+        last_column = board.num_columns - 1
+        corners = [board.index(row, column) for row in (0, last_row) for column in (0, last_column)]
+        for i in corners:
+            if cells[i] & COVERED and self.is_rest(i, analysis):
+                return i
+        start = rng.randrange(len(cells)) if rng is not None else 0
+        for offset in range(len(cells)):
+            i = (start + offset) % len(cells)
+            if cells[i] & COVERED and self.is_rest(i, analysis):
+                return i
+        return None
+
+    def is_rest(self, index, analysis):
+        return index not in analysis.probabilities and index not in analysis.safe and index not in analysis.mines
+
+
+def convolve(first, second):
+    """adds up two distributions of mine counts, {mines: ways}
+    """
+    result = {}
+    for a, ways_a in first.items():
+        for b, ways_b in second.items():
+            result[a + b] = result.get(a + b, 0) + ways_a * ways_b
+    return result
+
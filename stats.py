@@ -0,0 +1,155 @@
+""" keeps the result of every finished game in a SQLite database, run `python stats.py --help`
+to look at them from the command line
+
+there is one row per game with the board it was played on, the seed, the time to the
+millisecond, the clicks, the 3BV of the board and whether it was won. the games_best index
+orders the games of each kind of board by outcome and time, so the best times are the first
+rows of an index range and a percentile is a count or an offset into it, neither reads the
+table itself. run `python benchmark.py stats` to time the queries on a million games.
+"""
+import argparse
+import sqlite3
+import time
+
+from board import ADJACENT, MINE
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    finished REAL NOT NULL,
+    num_rows INTEGER NOT NULL,
+    num_columns INTEGER NOT NULL,
+    num_mines INTEGER NOT NULL,
+    no_guess INTEGER NOT NULL,
+    seed INTEGER,
+    milliseconds INTEGER NOT NULL,
+    clicks INTEGER NOT NULL,
+    three_bv INTEGER,
+    won INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS games_best ON games (num_rows, num_columns, num_mines, no_guess, won, milliseconds);
+"""
+
+# what picks out one kind of board, the games of different kinds are never compared
+KIND = "num_rows = ? AND num_columns = ? AND num_mines = ? AND no_guess = ?"
+
+
+def three_bv(board):
+    """returns the 3BV of a board, the fewest left clicks that clear it: one for every opening
+    of tiles with no mines around them and one for every other safe tile that no opening
+    uncovers. takes time in the size of the board, so the game works it out in the background
+    while the board is played
+    """
+    cells = board.cells
+    num_rows = board.num_rows
+    num_columns = board.num_columns
+    # tiles that an opening or a click already counted
+    counted = bytearray(len(cells))
+    clicks = 0
+    for start in range(len(cells)):
+        if counted[start] or cells[start] & (MINE | ADJACENT):
+            continue
+        clicks += 1
+        counted[start] = 1
+        stack = [start]
+        while stack:
+            row, column = divmod(stack.pop(), num_columns)
+            for r in range(max(row - 1, 0), min(row + 2, num_rows)):
+                for i in range(r * num_columns + max(column - 1, 0), r * num_columns + min(column + 2, num_columns)):
+                    if not counted[i]:
+                        counted[i] = 1
+                        if not cells[i] & ADJACENT:
+                            stack.append(i)
+    for i in range(len(cells)):
+        if not counted[i] and not cells[i] & MINE:
+            clicks += 1
+    return clicks
+
+
+class Stats(object):
+    """ the database of finished games at path, made the first time it is opened
+    """
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def record(self, num_rows, num_columns, num_mines, no_guess, seed, milliseconds, clicks, three_bv, won):
+        """adds a finished game, three_bv is None when it wasn't worked out
+        """
+        with self.connection:
+            self.connection.execute(
+                "INSERT INTO games (finished, num_rows, num_columns, num_mines, no_guess, seed, milliseconds, clicks,"
+                " three_bv, won) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (time.time(), num_rows, num_columns, num_mines, int(no_guess), seed, milliseconds, clicks, three_bv,
+                 int(won)))
+
+    def best_times(self, kind, limit=10):
+        """returns (milliseconds, three_bv, clicks, finished) of the fastest wins on a kind of
+        board, kind is (num_rows, num_columns, num_mines, no_guess)
+        """
+        return self.connection.execute(
+            f"SELECT milliseconds, three_bv, clicks, finished FROM games WHERE {KIND} AND won = 1"
+            " ORDER BY milliseconds LIMIT ?", (*kind, limit)).fetchall()
+
+    def counts(self, kind):
+        """returns (games, wins) on a kind of board
+        """
+        games = self.connection.execute(f"SELECT COUNT(*) FROM games WHERE {KIND}", kind).fetchone()[0]
+        return games, self.wins(kind)
+
+    def wins(self, kind, slower_than=-1):
+        """returns the number of wins on a kind of board that took more than slower_than
+        milliseconds
+        """
+        return self.connection.execute(
+            f"SELECT COUNT(*) FROM games WHERE {KIND} AND won = 1 AND milliseconds > ?",
+            (*kind, slower_than)).fetchone()[0]
+
+    def percentile(self, kind, fraction):
+        """returns the win time that fraction of the wins on a kind of board were at least as
+        fast as, None without wins
+        """
+        wins = self.wins(kind)
+        if not wins:
+            return None
+        offset = min(int(fraction * wins), wins - 1)
+        return self.connection.execute(
+            f"SELECT milliseconds FROM games WHERE {KIND} AND won = 1 ORDER BY milliseconds LIMIT 1 OFFSET ?",
+            (*kind, offset)).fetchone()[0]
+
+    def rank(self, kind, milliseconds):
+        """returns (slower, wins), the number of wins on a kind of board that were slower than
+        milliseconds and the number of wins
+        """
+        return self.wins(kind, milliseconds), self.wins(kind)
+
+    def close(self):
+        self.connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('database', nargs='?', default='minesweeper.db')
+    parser.add_argument('--rows', type=int, default=16)
+    parser.add_argument('--columns', type=int, default=16)
+    parser.add_argument('--mines', type=int, default=40)
+    parser.add_argument('--no-guess', action='store_true', help='show the no-guess games')
+    parser.add_argument('--limit', type=int, default=10, help='best times to show')
+    args = parser.parse_args()
+
+    stats = Stats(args.database)
+    kind = (args.rows, args.columns, args.mines, int(args.no_guess))
+    games, wins = stats.counts(kind)
+    print(f"{args.rows}x{args.columns} {args.mines} mines: {games} games, {wins} won")
+    for place, (milliseconds, bbbv, clicks, finished) in enumerate(stats.best_times(kind, args.limit), 1):
+        speed = f"{bbbv / max(milliseconds, 1) * 1000:6.2f} 3BV/s" if bbbv else ""
+        print(f"{place:3}. {milliseconds / 1000:9.3f} s  {clicks:5} clicks  {speed}  "
+              f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(finished))}")
+    if wins:
+        print("wins p50 {:.3f} s  p90 {:.3f} s".format(stats.percentile(kind, 0.5) / 1000,
+                                                       stats.percentile(kind, 0.9) / 1000))
+    stats.close()
+
+
+if __name__ == '__main__':
+    main()
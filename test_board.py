@@ -0,0 +1,16 @@
+""" tests for the board engine, run with `python -m pytest`
+"""
+from board import Board
+
+
+def test_reveal_mine_free_board():
+    """uncovering one corner of a 1000x1000 board without mines reveals every tile and wins
+    """
+    board = Board(1000, 1000, 0, seed=0)
+    revealed = board.uncover(0, 0)
+    assert len(revealed) == 1000 * 1000
+    assert len(set(revealed)) == 1000 * 1000
+    assert board.covered_safe == 0
+    assert board.game_won
+    assert not board.game_over
+    assert board.uncovered_tiles() == list(range(1000 * 1000))